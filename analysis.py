@@ -1,49 +1,233 @@
+import re
 import string
-from collections import Counter
+import time
+import unicodedata
+from collections import Counter, deque, namedtuple
+from functools import lru_cache
+import streamlit as st
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 import matplotlib.pyplot as plt
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 
 
+# ASCII punctuation plus Unicode punctuation such as curly quotes and dashes, which
+# speech recognizers emit; the Basic Multilingual Plane holds all that occur in practice
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation + ''.join(
+    chr(code) for code in range(0x10000) if unicodedata.category(chr(code)).startswith('P')))
+
+
 def clean_text(text):
     lower_case = text.lower()
-    cleansed_text = lower_case.translate(str.maketrans('', '', string.punctuation))
+    cleansed_text = lower_case.translate(_PUNCTUATION_TABLE)
     return cleansed_text
 
 
-def tokenize_and_filter(text):
-    tokenize_words = word_tokenize(text, "english")
-    final_words = [word for word in tokenize_words if word not in stopwords.words("english")]
+def clean_texts(texts):
+    return [text.lower().translate(_PUNCTUATION_TABLE) for text in texts]
+
+
+def clean_text_series(series):
+    """
+    Vectorized clean_text over a pandas Series of comments, e.g. a column read
+    from the comments table. Missing values stay missing.
+    """
+    return series.str.lower().str.translate(_PUNCTUATION_TABLE)
+
+
+# Domain-specific words dropped alongside the NLTK stop word list
+EXTRA_STOP_WORDS = frozenset()
+# Kept even though NLTK lists some of them as stop words: dropping them would turn
+# "no access to technology" into "access technology"
+NEGATIONS = frozenset({'no', 'not', 'nor', 'never', 'none', 'neither', 'without', 'cannot'})
+
+
+@lru_cache(maxsize=None)
+def get_stop_words(language="english", extra_stop_words=EXTRA_STOP_WORDS):
+    # Loaded from the corpus on first use of each language, then reused
+    return frozenset(stopwords.words(language)).difference(NEGATIONS).union(extra_stop_words)
+
+
+def nltk_tokenize(text, language="english"):
+    return word_tokenize(text, language)
+
+
+# Words the Treebank tokenizer behind word_tokenize always splits in two
+_TREEBANK_SPLITS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+
+def fast_tokenize(text, language="english"):
+    # Text from clean_text is already lowercased and free of punctuation, so a
+    # whitespace split plus the Treebank word splits yields the same words as
+    # nltk_tokenize without Punkt or the Treebank regexes
+    words = text.split()
+    if _TREEBANK_SPLITS.keys().isdisjoint(words):
+        return words
+    return [part for word in words for part in _TREEBANK_SPLITS.get(word, (word,))]
+
+
+TOKENIZERS = {
+    "nltk": nltk_tokenize,
+    "fast": fast_tokenize,
+}
+
+
+def tokenize_and_filter(text, language="english", extra_stop_words=EXTRA_STOP_WORDS, tokenizer="nltk"):
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f"Unknown tokenizer {tokenizer!r}, expected one of {sorted(TOKENIZERS)}")
+    stop_words = get_stop_words(language, frozenset(extra_stop_words))
+    tokenize_words = TOKENIZERS[tokenizer](text, language)
+    final_words = [word for word in tokenize_words if word not in stop_words]
     return final_words
 
 
-def analyze_emotions(final_words):
+LEXICON_PATH = 'farmer_emotions.txt'
+
+# One "'term': 'emotion'," entry of the dict literal in farmer_emotions.txt. The
+# term is matched greedily so keys with an inner apostrophe (farmers' rights) parse.
+_LEXICON_ENTRY = re.compile(r"""^\s*(['"])(?P<term>.+)\1\s*:\s*(['"])(?P<emotion>.*)\3\s*,?\s*$""")
+
+
+def normalize_term(term):
+    return ' '.join(clean_text(term).split())
+
+
+def parse_lexicon(lines):
+    """
+    Yield (term, emotion) pairs from the lines of the emotion lexicon file.
+    """
+    for line in lines:
+        match = _LEXICON_ENTRY.match(line)
+        if match:
+            yield match.group('term'), match.group('emotion')
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over token sequences. Every phrase occurring in a token
+    stream is found in one pass, however many phrases the automaton holds.
+    """
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for tokens, value in phrases:
+            self._add(tokens, value)
+        self._build()
+
+    def _add(self, tokens, value):
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(tokens), value))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(token, 0)
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def finditer(self, tokens):
+        """
+        Yield (start, end, value) for every phrase match, end exclusive.
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for length, value in output[state]:
+                yield position + 1 - length, position + 1, value
+
+
+class Lexicon:
+    """
+    Emotion lexicon parsed once and indexed by normalized term. Multi-word terms
+    are matched against the token stream by a PhraseMatcher; stop words are
+    dropped from the terms so they line up with tokenize_and_filter output, which
+    keeps negations, so "no access to technology" needs the "no".
+    """
+
+    def __init__(self, entries, stop_words=frozenset()):
+        self.index = {}
+        phrases = []
+        for term, emotion in entries:
+            key = normalize_term(term)
+            if not key:
+                continue
+            self.index[key] = emotion
+            tokens = tuple(token for token in key.split() if token not in stop_words)
+            if tokens:
+                phrases.append((tokens, emotion))
+        self.matcher = PhraseMatcher(phrases)
+
+    @classmethod
+    def from_file(cls, path=LEXICON_PATH, stop_words=frozenset()):
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(parse_lexicon(file), stop_words)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, term):
+        return term in self.index
+
+    def matches(self, final_words):
+        return list(self.matcher.finditer(final_words))
+
+    def lookup(self, final_words):
+        return [emotion for _, _, emotion in self.matcher.finditer(final_words)]
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(path=LEXICON_PATH):
+    return Lexicon.from_file(path, get_stop_words())
+
+
+def analyze_emotions(final_words, lexicon=None):
     """
     Analyze emotions based on the final words.
     """
-    emotion_list = []
-    try:
-        with open('farmer_emotions.txt', 'r') as file:
-            for line in file:
-                try:
-                    # Split the line into word and emotion
-                    word, emotion = line.strip().split(':', 1)  # Split on the first colon only
-                    if word in final_words:
-                        emotion_list.append(emotion)
-                except ValueError:
-                    # Skip lines that don't have the expected format
-                    continue
-    except FileNotFoundError:
-        st.error("❌ Emotion lexicon file 'farmer_emotions.txt' not found.")
-        return {}
-
-    emotion_counts = Counter(emotion_list)
+    if lexicon is None:
+        try:
+            lexicon = load_lexicon()
+        except FileNotFoundError:
+            st.error("❌ Emotion lexicon file 'farmer_emotions.txt' not found.")
+            return {}
+
+    emotion_counts = Counter(lexicon.lookup(final_words))
     return emotion_counts
 
 
-def sentiment_analysis(text):
-    score = SentimentIntensityAnalyzer().polarity_scores(text)
+@lru_cache(maxsize=None)
+def get_sentiment_analyzer():
+    # VADER parses its whole lexicon on construction, so build it once per process
+    return SentimentIntensityAnalyzer()
+
+
+def stress_label(score):
     neg = score['neg']
     pos = score['pos']
 
@@ -55,6 +239,83 @@ def sentiment_analysis(text):
         return "Neutral Stress Level"
 
 
+def sentiment_analysis(text):
+    score = get_sentiment_analyzer().polarity_scores(text)
+    return stress_label(score)
+
+
+def sentiment_analysis_batch(texts):
+    """
+    Score many texts with the shared analyzer. Each result holds the raw VADER
+    neg/neu/pos/compound scores plus the stress label under 'label'.
+    """
+    analyzer = get_sentiment_analyzer()
+    results = []
+    for text in texts:
+        score = analyzer.polarity_scores(text)
+        results.append(dict(score, label=stress_label(score)))
+    return results
+
+
+AnalysisResult = namedtuple('AnalysisResult', ['emotions', 'sentiment', 'scores', 'timings'])
+
+
+class AnalysisPipeline:
+    """
+    Runs clean -> tokenize -> emotions -> sentiment over resources that are loaded
+    once when the pipeline is built (stop words, lexicon index, VADER analyzer).
+    Build one per process and share it between the UI and batch jobs.
+    """
+
+    def __init__(self, lexicon=None, analyzer=None, language="english",
+                 extra_stop_words=EXTRA_STOP_WORDS, tokenizer="nltk"):
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"Unknown tokenizer {tokenizer!r}, expected one of {sorted(TOKENIZERS)}")
+        self.language = language
+        self.tokenizer = tokenizer
+        self.extra_stop_words = frozenset(extra_stop_words)
+        self.stop_words = get_stop_words(language, self.extra_stop_words)
+        if lexicon is None:
+            lexicon = Lexicon.from_file(stop_words=self.stop_words)
+        if analyzer is None:
+            analyzer = get_sentiment_analyzer()
+        self.lexicon = lexicon
+        self.analyzer = analyzer
+
+    def analyze(self, text):
+        """
+        Analyze one transcript. timings maps each stage to its wall time in seconds.
+        """
+        timings = {}
+        start = time.perf_counter()
+        cleansed_text = clean_text(text)
+        now = time.perf_counter()
+        timings['clean'], start = now - start, now
+
+        final_words = [word for word in TOKENIZERS[self.tokenizer](cleansed_text, self.language)
+                       if word not in self.stop_words]
+        now = time.perf_counter()
+        timings['tokenize'], start = now - start, now
+
+        emotions = analyze_emotions(final_words, self.lexicon)
+        now = time.perf_counter()
+        timings['emotions'], start = now - start, now
+
+        scores = self.analyzer.polarity_scores(cleansed_text)
+        sentiment = stress_label(scores)
+        timings['sentiment'] = time.perf_counter() - start
+
+        return AnalysisResult(emotions, sentiment, scores, timings)
+
+    def analyze_many(self, texts):
+        return [self.analyze(text) for text in texts]
+
+
+@lru_cache(maxsize=None)
+def get_pipeline():
+    return AnalysisPipeline(load_lexicon())
+
+
 def plot_emotions(emotion_counts):
     fig, ax = plt.subplots()
     ax.bar(emotion_counts.keys(), emotion_counts.values())
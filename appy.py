@@ -2,16 +2,92 @@
 import streamlit as st
 import numpy as np
 import scipy.io.wavfile as wav
-import speech_recognition as sr
 import os
 import matplotlib.pyplot as plt
-from analysis import clean_text, tokenize_and_filter, analyze_emotions, sentiment_analysis, plot_emotions
-from database import create_users_table, insert_user, authenticate_user, reset_password, check_user_exists, \
-    create_comments_table, insert_comment
+from streamlit_webrtc import WebRtcMode, webrtc_streamer
+from analysis import plot_emotions, AnalysisPipeline
+from audio import AudioRecordingBuffer
+from speech import TranscriptCache
+from database import insert_user, authenticate_user, reset_password, check_user_exists, migrate
+from jobs import JobQueue, JobQueueFull, analyze_recording, save_analysis, QUEUED, RUNNING, DONE, CANCELLED
+
+
+@st.cache_resource
+def init_database():
+    # Create tables and apply schema migrations once per server process, not on every rerun
+    return migrate()
+
+
+init_database()
+
+
+@st.cache_resource
+def load_pipeline():
+    # Built once per server process and shared by every session
+    return AnalysisPipeline()
+
+
+@st.cache_resource
+def load_transcript_cache():
+    return TranscriptCache()
+
+
+@st.cache_resource
+def load_job_queue():
+    # Recordings are transcribed and analyzed on worker threads so script runs never block on ASR
+    pipeline = load_pipeline()
+    cache = load_transcript_cache()
+    return JobQueue(lambda audio_data, stop: analyze_recording(audio_data, pipeline, cache, stop=stop),
+                    on_done=save_analysis)
+
+
+@st.fragment(run_every=1)
+def show_job_status():
+    job_queue = load_job_queue()
+    job = job_queue.status(st.session_state.job_id)
+    if job is not None and job['status'] in (QUEUED, RUNNING):
+        st.info("⏳ Analyzing your voice note...")
+        if st.button("✖ Cancel Analysis"):
+            job_queue.cancel(job['id'])
+        return
+    # Finished: stop polling and let the full page show the outcome
+    st.session_state.job_id = None
+    st.session_state.finished_job = job
+    st.rerun()
+
+
+@st.fragment(run_every=1)
+def show_recording_status():
+    audio_buffer = st.session_state.audio_buffer
+    if audio_buffer.full:
+        # Stop at the limit instead of silently losing what is said after it
+        st.session_state.recording = False
+        st.session_state.audio_data = audio_buffer.to_audio_data()
+        st.rerun()
+    st.markdown('<div class="wave"></div>', unsafe_allow_html=True)  # Display wave animation
+    st.write(f"Recording... Speak now! ({audio_buffer.seconds:.0f}s of {audio_buffer.max_seconds // 60} minutes)")
+
+
+def show_job_result(job):
+    if job['status'] == DONE:
+        result = job['result']
+        st.write("🗣️ You said:", result['comment'])
+        st.write(f"📊 Sentiment: {result['sentiment'].capitalize()}")
+        st.pyplot(plot_emotions(result['emotions']))
+        st.caption(f"Skipped {result['silence_seconds']:.1f}s of silence and sent "
+                   f"{result['payload_bytes'] / 1024:.0f} KB of {result['captured_bytes'] / 1024:.0f} KB recorded "
+                   f"(prepared in {result['prepare_seconds'] * 1000:.0f} ms).")
+        chunks = result.get('chunks', [])
+        if len(chunks) > 1:
+            st.caption(f"Transcribed in {len(chunks)} parts, slowest "
+                       f"{max(chunk['seconds'] for chunk in chunks):.1f}s, "
+                       f"total {sum(chunk['seconds'] for chunk in chunks):.1f}s of recognition time.")
+        st.success("✅ Voice note submitted successfully!")
+    elif job['status'] == CANCELLED:
+        st.warning("Analysis cancelled.")
+    else:
+        st.error(f"❌ {job['error']}")
 
-# Create database tables
-create_users_table()
-create_comments_table()
 
 # Initialize session state variables
 if 'page' not in st.session_state:
@@ -24,6 +100,12 @@ if 'audio_data' not in st.session_state:
     st.session_state.audio_data = None
 if 'recording' not in st.session_state:
     st.session_state.recording = False
+if 'audio_buffer' not in st.session_state:
+    st.session_state.audio_buffer = AudioRecordingBuffer()
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'finished_job' not in st.session_state:
+    st.session_state.finished_job = None
 
 # Custom CSS for styling
 st.markdown(
@@ -129,56 +211,54 @@ elif st.session_state.page == "Home":
     with col1:
         if st.button("🎤 Start Recording") and not st.session_state.recording:
             st.session_state.recording = True
-            st.markdown('<div class="wave"></div>', unsafe_allow_html=True)  # Display wave animation
-
-            # Initialize recognizer
-            recognizer = sr.Recognizer()
-            with sr.Microphone() as source:
-                st.write("Recording... Speak now!")
-                audio_data = recognizer.listen(source)
-                st.session_state.audio_data = audio_data
-                st.success("✅ Recording finished!")
-                st.session_state.recording = False
+            st.session_state.audio_data = None  # the previous note can no longer be submitted
+            st.session_state.audio_buffer.clear()
 
     with col2:
         if st.session_state.recording:
             if st.button("⏹ Stop Recording"):
                 st.session_state.recording = False
-                st.success("✅ Recording stopped!")
+                st.session_state.audio_data = st.session_state.audio_buffer.to_audio_data()
+                if st.session_state.audio_data is None:
+                    st.error("❌ No audio was captured. Please allow microphone access and try again.")
+                else:
+                    st.success("✅ Recording stopped!")
         else:
             st.button("⏹ Stop Recording", disabled=True)  # Disable stop button if no recording in progress
 
     with col3:
         if st.session_state.audio_data is not None:
-            if st.button("📤 Submit for Analysis"):
+            if st.button("📤 Submit for Analysis", disabled=st.session_state.job_id is not None):
                 try:
-                    # Recognize speech using Google Web Speech API
-                    comment = recognizer.recognize_google(st.session_state.audio_data)
-                    st.write("🗣️ You said:", comment)
-
-                    # Analyze text
-                    cleansed_text = clean_text(comment)
-                    final_words = tokenize_and_filter(cleansed_text)
-                    emotions = analyze_emotions(final_words)
-                    sentiment = sentiment_analysis(cleansed_text)
-
-                    # Display Results
-                    st.write(f"📊 Sentiment: {sentiment.capitalize()}")
-                    st.pyplot(plot_emotions(emotions))
-
-                    # Save to DB
-                    insert_comment(st.session_state.username, comment, sentiment, "Unknown", "Unknown", "Unknown",
-                                   "Unknown")
-                    st.success("✅ Voice note submitted successfully!")
-
-                except sr.UnknownValueError:
-                    st.error("❌ Speech Recognition could not understand the audio.")
-                except sr.RequestError as e:
-                    st.error(f"❌ Could not request results from Speech Recognition service: {e}")
+                    # Queue the recording; transcription, analysis and saving run in the background
+                    st.session_state.job_id = load_job_queue().submit(st.session_state.username,
+                                                                      st.session_state.audio_data)
+                    st.session_state.finished_job = None
+                except JobQueueFull:
+                    st.error("❌ Too many voice notes are being analyzed right now. Please try again shortly.")
 
         else:
             st.button("📤 Submit for Analysis", disabled=True)  # Disable Submit button if no audio is recorded
 
+    # Audio is captured in the browser and streamed into this session's recording buffer
+    webrtc_streamer(
+        key="recorder",
+        mode=WebRtcMode.SENDONLY,
+        queued_audio_frames_callback=st.session_state.audio_buffer.write_frames,
+        media_stream_constraints={"audio": True, "video": False},
+        desired_playing_state=st.session_state.recording,
+    )
+    if st.session_state.recording:
+        show_recording_status()
+    elif st.session_state.audio_data is not None and st.session_state.audio_buffer.full:
+        st.warning(f"⚠️ Recording stopped at the {st.session_state.audio_buffer.max_seconds // 60} minute limit. "
+                   "Anything said after that was not captured.")
+
+    if st.session_state.job_id is not None:
+        show_job_status()
+    elif st.session_state.finished_job is not None:
+        show_job_result(st.session_state.finished_job)
+
 elif st.session_state.page == "About Us":
     st.markdown("<div class='stTitle'>About Us</div>", unsafe_allow_html=True)
     st.write(""" 
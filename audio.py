@@ -0,0 +1,247 @@
+import threading
+from math import gcd
+
+import numpy as np
+import speech_recognition as sr
+from scipy.signal import resample_poly
+
+# Longest recording kept per session, enough for the longest voice notes farmers leave;
+# capture stops once it is reached rather than overwriting the start
+RECORDING_MAX_SECONDS = 600
+# Recording storage grows in blocks of this many seconds, so short notes stay small
+RECORDING_BLOCK_SECONDS = 30
+# Format sent to speech recognition; higher rates add payload without adding accuracy
+TARGET_SAMPLE_RATE = 16000
+
+
+class AudioRecordingBuffer:
+    """
+    Mono 16-bit buffer fed with browser audio frames. Frames are downmixed and
+    written in place into preallocated blocks, never appended to a list, and
+    to_audio_data() makes a single copy into the AudioData it returns. Blocks are
+    allocated as the recording grows, once its sample rate is known, and reused for
+    every later recording. Samples past max_seconds are dropped and full is set.
+    """
+
+    sample_width = 2
+
+    def __init__(self, max_seconds=RECORDING_MAX_SECONDS, block_seconds=RECORDING_BLOCK_SECONDS):
+        self.max_seconds = max_seconds
+        self.block_seconds = block_seconds
+        self.sample_rate = None
+        self.full = False
+        self._blocks = []
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def write_frame(self, frame):
+        """
+        audio_frame_callback for streamlit-webrtc: store an av.AudioFrame downmixed
+        to mono and pass the frame through unchanged.
+        """
+        samples = frame.to_ndarray()
+        if frame.format.is_planar:
+            samples = samples.T  # one row per channel -> interleaved
+        samples = samples.reshape(-1)
+        if samples.dtype.kind == 'f':
+            samples = samples * 32767.0
+        samples = normalize_samples(samples, frame.sample_rate, len(frame.layout.channels),
+                                    target_rate=frame.sample_rate)
+        self.write(samples, frame.sample_rate)
+        return frame
+
+    async def write_frames(self, frames):
+        """
+        queued_audio_frames_callback for streamlit-webrtc: store every frame queued
+        since the last call, in order. The single-frame audio_frame_callback only
+        sees the newest frame when several are waiting, which drops speech under load.
+        """
+        for frame in frames:
+            self.write_frame(frame)
+        return frames
+
+    def write(self, samples, sample_rate):
+        with self._lock:
+            if sample_rate != self.sample_rate:
+                self.sample_rate = sample_rate
+                self._blocks = []
+                self._written = 0
+                self.full = False
+            room = int(sample_rate * self.max_seconds) - self._written
+            if len(samples) > room:
+                samples = samples[:room]
+                self.full = True
+            block_length = int(sample_rate * self.block_seconds)
+            offset = 0
+            while offset < len(samples):
+                index, start = divmod(self._written, block_length)
+                if index == len(self._blocks):
+                    self._blocks.append(np.empty(block_length, dtype=np.int16))
+                count = min(block_length - start, len(samples) - offset)
+                self._blocks[index][start:start + count] = samples[offset:offset + count]
+                offset += count
+                self._written += count
+
+    @property
+    def seconds(self):
+        if self.sample_rate is None:
+            return 0.0
+        return self._written / self.sample_rate
+
+    def clear(self):
+        with self._lock:
+            self._written = 0
+            self.full = False
+
+    def to_audio_data(self):
+        """
+        Return the buffered audio as AudioData, or None if nothing was recorded.
+        """
+        with self._lock:
+            if not self._written:
+                return None
+            frame_data = bytearray(self._written * self.sample_width)
+            out = np.frombuffer(frame_data, dtype=np.int16)
+            offset = 0
+            for block in self._blocks:
+                count = min(len(block), self._written - offset)
+                out[offset:offset + count] = block[:count]
+                offset += count
+                if offset == self._written:
+                    break
+        return sr.AudioData(frame_data, self.sample_rate, self.sample_width)
+
+
+def pcm_samples(audio_data):
+    """
+    View audio_data as a 1-D int16 array, converting the sample width if needed.
+    """
+    raw_data = audio_data.frame_data if audio_data.sample_width == 2 else audio_data.get_raw_data(convert_width=2)
+    return np.frombuffer(raw_data, dtype=np.int16)
+
+
+def normalize_samples(samples, sample_rate, channels=1, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Downmix interleaved samples to mono and resample them to target_rate with a
+    polyphase filter. Returns int16 samples.
+    """
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    if sample_rate != target_rate:
+        divisor = gcd(target_rate, sample_rate)
+        samples = resample_poly(samples.astype(np.float32), target_rate // divisor, sample_rate // divisor)
+    if samples.dtype != np.int16:
+        samples = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+    return samples
+
+
+def normalize_audio(audio_data, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Convert audio_data to 16-bit mono at target_rate without a WAV round trip.
+    Audio already in that format is returned as is.
+    """
+    if audio_data.sample_rate == target_rate and audio_data.sample_width == 2:
+        return audio_data
+    samples = normalize_samples(pcm_samples(audio_data), audio_data.sample_rate, target_rate=target_rate)
+    return sr.AudioData(samples.tobytes(), target_rate, 2)
+
+
+def speech_frames(samples, sample_rate, frame_ms=30, energy_margin_db=12.0, min_energy_db=-55.0,
+                  peak_margin_db=25.0, zcr_threshold=0.25, hangover_ms=200):
+    """
+    Energy and zero-crossing-rate voice activity detection. Returns a boolean array
+    with one entry per frame_ms frame, True where speech is likely, and the frame
+    length in samples.
+
+    A frame is speech when its energy is energy_margin_db above the recording's
+    noise floor (its 10th percentile frame energy), or a little less loud but with
+    a high zero-crossing rate, which catches unvoiced consonants like "s" and "f".
+    The threshold never sits more than peak_margin_db below the loudest frame, so
+    a recording with no pauses at all is not mistaken for silence.
+    Speech frames are then widened by hangover_ms on each side so word onsets and
+    short gaps between words are kept.
+    """
+    frame_length = max(1, int(sample_rate * frame_ms / 1000))
+    count = len(samples) // frame_length
+    if not count:
+        return np.zeros(0, dtype=bool), frame_length
+    frames = samples[:count * frame_length].reshape(count, frame_length).astype(np.float32) / 32768.0
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+
+    threshold = min(np.percentile(energy_db, 10) + energy_margin_db, energy_db.max() - peak_margin_db)
+    threshold = max(threshold, min_energy_db)
+    speech = (energy_db > threshold) | ((energy_db > threshold - energy_margin_db / 2) & (zcr > zcr_threshold))
+
+    hangover = int(hangover_ms / frame_ms)
+    if hangover:
+        speech = np.convolve(speech, np.ones(2 * hangover + 1), mode='same') > 0
+    return speech, frame_length
+
+
+def trim_silence(audio_data, max_pause_ms=500, hangover_ms=200, **vad_options):
+    """
+    Shorten internal pauses to at most max_pause_ms and leading and trailing
+    silence to hangover_ms, which keeps soft word onsets and endings. Returns
+    (trimmed AudioData, seconds removed); the AudioData is None when no speech was
+    found.
+    """
+    samples = pcm_samples(audio_data)
+    sample_rate = audio_data.sample_rate
+    # Pauses are measured on the unwidened VAD mask; widening speech by the
+    # hangover first would leave max_pause_ms + 2 * hangover_ms of every pause
+    speech, frame_length = speech_frames(samples, sample_rate, hangover_ms=0, **vad_options)
+    total_seconds = len(samples) / sample_rate
+    if not speech.any():
+        return None, total_seconds
+
+    keep = speech.copy()
+    max_pause = int(max_pause_ms * sample_rate / 1000) // frame_length
+    hangover = int(hangover_ms * sample_rate / 1000) // frame_length
+    # Padding with silence makes edges alternate speech start, speech end
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], speech, [False])).astype(np.int8)))
+    keep[max(0, edges[0] - hangover):edges[0]] = True
+    keep[edges[-1]:edges[-1] + hangover] = True
+    # Runs of silence strictly between speech are kept whole up to max_pause, longer
+    # ones keep half of max_pause at each edge
+    for start, end in zip(edges[1:-1:2], edges[2::2]):
+        if end - start <= max_pause:
+            keep[start:end] = True
+        else:
+            keep[start:start + max_pause // 2] = True
+            keep[end - (max_pause - max_pause // 2):end] = True
+
+    frames = samples[:len(speech) * frame_length].reshape(len(speech), frame_length)
+    trimmed = frames[keep].reshape(-1)
+    if keep[-1]:
+        trimmed = np.concatenate((trimmed, samples[len(speech) * frame_length:]))
+    trimmed_audio = sr.AudioData(trimmed.tobytes(), sample_rate, 2)
+    return trimmed_audio, total_seconds - len(trimmed) / sample_rate
+
+
+def split_at_pauses(audio_data, max_chunk_seconds=30.0, **vad_options):
+    """
+    Split audio_data into chunks of at most max_chunk_seconds, cutting in the middle
+    of the last pause before each limit so words are not split. A stretch with no
+    pause at all is cut at the limit. Returns a list of AudioData in order.
+    """
+    samples = pcm_samples(audio_data)
+    sample_rate = audio_data.sample_rate
+    max_length = int(max_chunk_seconds * sample_rate)
+    if len(samples) <= max_length:
+        return [audio_data]
+    speech, frame_length = speech_frames(samples, sample_rate, **vad_options)
+    # Candidate cut points: the sample at the middle of each run of silent frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([True], speech, [True])).astype(np.int8)))
+    pauses = (edges[0::2] + edges[1::2]) // 2 * frame_length
+
+    chunks = []
+    start = 0
+    while len(samples) - start > max_length:
+        limit = start + max_length
+        candidates = pauses[(pauses > start) & (pauses <= limit)]
+        end = int(candidates[-1]) if len(candidates) else limit
+        chunks.append(sr.AudioData(samples[start:end].tobytes(), sample_rate, 2))
+        start = end
+    chunks.append(sr.AudioData(samples[start:].tobytes(), sample_rate, 2))
+    return chunks
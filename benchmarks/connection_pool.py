@@ -0,0 +1,128 @@
+"""
+Latency of login and comment inserts from many concurrent sessions, through the
+connection pool against opening and closing a connection per call as the app
+originally did.
+
+    python -m benchmarks.connection_pool --sessions 50 --iterations 20
+
+Each session logs in and inserts a comment iterations times. Both runs use a fresh
+database in a temporary directory, never database.db.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+import database
+
+
+def connect_per_call_login(path, username, password):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''
+        SELECT * FROM users WHERE username = ? AND password = ?
+    ''', (username, password))
+    user = c.fetchone()
+    conn.close()
+    return user
+
+
+def connect_per_call_insert(path, name, comment, sentiment):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area)
+        VALUES (?, ?, ?, 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+    ''', (name, comment, sentiment))
+    conn.commit()
+    conn.close()
+
+
+def pooled_login(path, username, password):
+    return database.authenticate_user(username, password)
+
+
+def pooled_insert(path, name, comment, sentiment):
+    database.insert_comment(name, comment, sentiment, 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+
+
+def run_sessions(path, login, insert, sessions, iterations):
+    """
+    Return (per-operation latencies in seconds, error count, wall seconds).
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(sessions)
+
+    def session(n):
+        username = f'farmer{n}'
+        timings = []
+        start_line.wait()
+        for i in range(iterations):
+            try:
+                start = time.perf_counter()
+                login(path, username, 'secret')
+                timings.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                insert(path, username, f'comment {i} from session {n}', 'High Stress')
+                timings.append(time.perf_counter() - start)
+            except sqlite3.Error as e:
+                errors.append(e)
+        with lock:
+            latencies.extend(timings)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.perf_counter() - start
+
+
+def report(name, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"{name:<16} {len(latencies) / elapsed:8.0f} ops/sec  p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+          f"p95 {p95 * 1000:6.2f} ms  max {latencies[-1] * 1000:7.2f} ms  {errors} errors")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pooled against per-call SQLite connections.")
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_path = os.path.join(directory, 'baseline.db')
+        conn = sqlite3.connect(baseline_path)
+        conn.execute(database.USERS_TABLE_SQL)
+        conn.execute(database.COMMENTS_TABLE_SQL)
+        conn.executemany('INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
+                         [(f'farmer{n}', 'secret', f'farmer{n}@example.com') for n in range(args.sessions)])
+        conn.commit()
+        conn.close()
+        report('connect/close', *run_sessions(baseline_path, connect_per_call_login, connect_per_call_insert,
+                                              args.sessions, args.iterations))
+
+        # The pooled helpers use the relative DATABASE_PATH, so run them from the
+        # temporary directory
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            database.migrate()
+            for n in range(args.sessions):
+                database.insert_user(f'farmer{n}', 'secret', f'farmer{n}@example.com')
+            report('pool', *run_sessions(database.DATABASE_PATH, pooled_login, pooled_insert, args.sessions,
+                                         args.iterations))
+        finally:
+            database.close_pools()
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Emotion lookup cost with synthetic lexicons of 1k, 10k and 100k entries: the
+original path, which re-read and scanned the lexicon file on every call, against
+the Lexicon index built once and matched with its PhraseMatcher.
+
+    python -m benchmarks.lexicon --sizes 1000 10000 100000 --calls 50
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from analysis import Lexicon
+
+EMOTIONS = ('anxiety', 'hope', 'frustration', 'relief', 'fear', 'anger', 'sadness', 'joy')
+
+
+def write_lexicon(path, size, rng):
+    """
+    Write size entries in the farmer_emotions.txt format, a third of them
+    multi-word phrases, and return the vocabulary they use.
+    """
+    vocabulary = [f'word{n}' for n in range(size)]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('{\n')
+        for n in range(size):
+            words = [vocabulary[n]] + rng.sample(vocabulary, n % 3)
+            file.write(f"    '{' '.join(words)}': '{rng.choice(EMOTIONS)}',\n")
+        file.write('}\n')
+    return vocabulary
+
+
+def original_analyze_emotions(path, final_words):
+    # The lookup as first written: the file is read and every line tested per call
+    emotion_list = []
+    with open(path, 'r') as file:
+        for line in file:
+            try:
+                word, emotion = line.strip().split(':', 1)
+                if word.strip().strip("'") in final_words:
+                    emotion_list.append(emotion)
+            except ValueError:
+                continue
+    return Counter(emotion_list)
+
+
+def time_calls(function, comments):
+    start = time.perf_counter()
+    for final_words in comments:
+        function(final_words)
+    return (time.perf_counter() - start) / len(comments)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the emotion lexicon index against per-call file scans.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--words', type=int, default=120, help="tokens per synthetic comment")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = os.path.join(directory, f'lexicon_{size}.txt')
+            vocabulary = write_lexicon(path, size, rng)
+            comments = [rng.sample(vocabulary, min(args.words, size)) for _ in range(args.calls)]
+
+            start = time.perf_counter()
+            lexicon = Lexicon.from_file(path)
+            build = time.perf_counter() - start
+            original = time_calls(lambda words: original_analyze_emotions(path, words), comments)
+            indexed = time_calls(lexicon.lookup, comments)
+            print(f"{size:>7} entries: original {original * 1000:8.2f} ms/call  index {indexed * 1000:7.3f} ms/call  "
+                  f"({original / indexed:,.0f}x)  index built once in {build * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Per-comment VADER scoring latency: building a SentimentIntensityAnalyzer for every
+call, as the app first did, against the shared get_sentiment_analyzer() and
+sentiment_analysis_batch().
+
+    python -m benchmarks.sentiment --comments 200
+"""
+import argparse
+import time
+
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+from analysis import sentiment_analysis, sentiment_analysis_batch, stress_label
+
+COMMENTS = (
+    "The drought has left us with low crop yield and the loan is due, this is bad.",
+    "Good rain this year and the harvest looks healthy, we are hopeful.",
+    "Pest infestation destroyed half of the maize farm and prices keep dropping.",
+    "We planted cassava on the east field and sold the yams at the market.",
+)
+
+
+def per_call_analyzer(text):
+    return stress_label(SentimentIntensityAnalyzer().polarity_scores(text))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark VADER analyzer reuse and batch scoring.")
+    parser.add_argument('--comments', type=int, default=200)
+    args = parser.parse_args(argv)
+    texts = [COMMENTS[n % len(COMMENTS)] for n in range(args.comments)]
+
+    timings = {}
+    start = time.perf_counter()
+    for text in texts:
+        per_call_analyzer(text)
+    timings['new analyzer per call'] = time.perf_counter() - start
+
+    sentiment_analysis(texts[0])  # build the shared analyzer outside the timing
+    start = time.perf_counter()
+    for text in texts:
+        sentiment_analysis(text)
+    timings['shared analyzer'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sentiment_analysis_batch(texts)
+    timings['batch'] = time.perf_counter() - start
+
+    baseline = timings['new analyzer per call']
+    for name, elapsed in timings.items():
+        print(f"{name:<22} {elapsed / len(texts) * 1000:8.3f} ms/comment  ({baseline / elapsed:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Stop word filtering cost on 5-minute voice-note transcripts (about 750 words at
+150 words a minute): the original filter, which reloaded the NLTK list for every
+token, against the frozenset cached per language by get_stop_words().
+
+    python -m benchmarks.stop_words --transcripts 20
+"""
+import argparse
+import random
+import time
+
+from nltk.corpus import stopwords
+
+from analysis import clean_text, get_stop_words, nltk_tokenize
+
+WORDS = (
+    "the drought this season has left us with low crop yield and we are worried about the loan "
+    "our maize farm was hit by pests but the cassava is doing well and the market price is not good "
+    "we need better access to fertilizer and water for irrigation before the next planting"
+).split()
+
+
+def transcript(rng, minutes=5, words_per_minute=150):
+    return ' '.join(rng.choice(WORDS) for _ in range(minutes * words_per_minute))
+
+
+def original_filter(tokens):
+    return [word for word in tokens if word not in stopwords.words("english")]
+
+
+def cached_filter(tokens):
+    stop_words = get_stop_words()
+    return [word for word in tokens if word not in stop_words]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark stop word filtering on long transcripts.")
+    parser.add_argument('--transcripts', type=int, default=20)
+    args = parser.parse_args(argv)
+    rng = random.Random(0)
+    token_lists = [nltk_tokenize(clean_text(transcript(rng))) for _ in range(args.transcripts)]
+    get_stop_words()  # load outside the timing, as the app does at startup
+
+    timings = {}
+    for name, function in (('original', original_filter), ('cached frozenset', cached_filter)):
+        start = time.perf_counter()
+        for tokens in token_lists:
+            function(tokens)
+        timings[name] = (time.perf_counter() - start) / len(token_lists)
+    for name, elapsed in timings.items():
+        print(f"{name:<17} {elapsed * 1000:9.3f} ms/transcript  ({timings['original'] / elapsed:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Tokenizer throughput on cleaned comments, in tokens per second, for each backend in
+analysis.TOKENIZERS.
+
+    python -m benchmarks.tokenizers --comments 2000
+"""
+import argparse
+import random
+import time
+
+from analysis import TOKENIZERS, clean_texts
+
+SENTENCES = (
+    "The drought has left us with low crop yield this season, and we cannot repay the loan.",
+    "Pest infestation destroyed half of the maize farm; we’re gonna replant next month.",
+    "Market price drop and “loan debt” are a heavy burden — the co-op can’t help.",
+    "Good rain this year and the harvest looks healthy, thank God!",
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tokenizer throughput.")
+    parser.add_argument('--comments', type=int, default=2000)
+    parser.add_argument('--sentences', type=int, default=8, help="sentences per comment")
+    args = parser.parse_args(argv)
+    rng = random.Random(0)
+    comments = clean_texts(' '.join(rng.choice(SENTENCES) for _ in range(args.sentences))
+                           for _ in range(args.comments))
+
+    rates = {}
+    for name, tokenize in TOKENIZERS.items():
+        start = time.perf_counter()
+        tokens = sum(len(tokenize(comment)) for comment in comments)
+        rates[name] = tokens / (time.perf_counter() - start)
+    slowest = min(rates.values())
+    for name, rate in rates.items():
+        print(f"{name:<6} {rate:12,.0f} tokens/sec  ({rate / slowest:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
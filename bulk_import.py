@@ -0,0 +1,200 @@
+"""
+Bulk load comments or users from a JSONL or CSV file, e.g. voice-note transcripts
+collected offline by field agents.
+
+    python bulk_import.py transcripts.jsonl --table comments --batch-size 5000 --defer-indexes
+
+Rows are streamed from the file, validated, and inserted with executemany in
+explicit transactions of batch-size rows.
+"""
+import argparse
+import csv
+import json
+import time
+from datetime import datetime, timezone
+
+from database import DATABASE_PATH, create_connection, migrate
+
+
+def parse_timestamp(value):
+    """
+    Normalize an ISO 8601 timestamp to the 'YYYY-MM-DD HH:MM:SS' UTC form that
+    CURRENT_TIMESTAMP stores, so imported rows sort and bucket like live ones.
+    Times without an offset are taken as UTC. Raises ValueError if unparseable.
+    """
+    value = value.strip()
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Per table: required fields, optional fields with their defaults, the insert
+# statement taking the required then the optional fields in order, and parsers that
+# normalize a field or raise ValueError to reject the row
+TABLES = {
+    'comments': {
+        'required': ('name', 'comment', 'sentiment'),
+        'optional': (
+            ('origin_city', 'Unknown'),
+            ('origin_area', 'Unknown'),
+            ('destination_city', 'Unknown'),
+            ('destination_area', 'Unknown'),
+            ('timestamp', None),
+        ),
+        'sql': '''
+            INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city,
+                                  destination_area, timestamp, sentiment_code)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP),
+                    (SELECT code FROM sentiment_labels WHERE label = ?3))
+        ''',
+        'parsers': {'timestamp': parse_timestamp},
+    },
+    'users': {
+        'required': ('username', 'password', 'email'),
+        'optional': (),
+        # Usernames are unique; rows for existing users are skipped, not overwritten
+        'sql': '''
+            INSERT OR IGNORE INTO users (username, password, email) VALUES (?, ?, ?)
+        ''',
+        'parsers': {},
+    },
+}
+
+
+def read_rows(path, fmt=None):
+    """
+    Yield one dict per record, or None for a JSONL line that does not parse.
+    """
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if fmt == 'csv':
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+def label_parser(labels):
+    def parse(value):
+        if value not in labels:
+            raise ValueError(f"unknown label {value!r}")
+        return value
+    return parse
+
+
+def validate_row(row, spec, parsers=None):
+    """
+    Return the insert parameters for row, or None if a required field is missing or
+    a field fails its parser.
+    """
+    if row is None:
+        return None
+    parsers = spec['parsers'] if parsers is None else parsers
+    values = []
+    for field in spec['required']:
+        value = row.get(field)
+        if value is None or not str(value).strip():
+            return None
+        values.append((field, str(value)))
+    for field, default in spec['optional']:
+        value = row.get(field)
+        values.append((field, str(value) if value not in (None, '') else default))
+    try:
+        return tuple(parsers[field](value) if field in parsers and value is not None else value
+                     for field, value in values)
+    except ValueError:
+        return None
+
+
+def _drop_indexes(conn, table):
+    # Only plain indexes are deferred; unique indexes stay to keep enforcing uniqueness
+    indexes = conn.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = ? AND sql LIKE 'CREATE INDEX%'
+    ''', (table,)).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def bulk_import(path, table='comments', fmt=None, database=DATABASE_PATH, batch_size=5000, defer_indexes=False):
+    """
+    Load path into table and return (inserted, invalid, skipped, elapsed seconds).
+    """
+    spec = TABLES[table]
+    migrate(database)
+    conn = create_connection(database)
+    conn.isolation_level = None
+    parsers = dict(spec['parsers'])
+    if table == 'comments':
+        # Unknown labels would be stored with a NULL sentiment_code
+        labels = frozenset(label for label, in conn.execute('SELECT label FROM sentiment_labels'))
+        parsers['sentiment'] = label_parser(labels)
+    inserted = invalid = skipped = 0
+    start = time.perf_counter()
+
+    def write(batch):
+        conn.execute('BEGIN')
+        try:
+            count = conn.executemany(spec['sql'], batch).rowcount
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return count
+
+    index_sql = _drop_indexes(conn, table) if defer_indexes else []
+    try:
+        batch = []
+        for row in read_rows(path, fmt):
+            values = validate_row(row, spec, parsers)
+            if values is None:
+                invalid += 1
+                continue
+            batch.append(values)
+            if len(batch) >= batch_size:
+                count = write(batch)
+                inserted += count
+                skipped += len(batch) - count
+                batch = []
+        if batch:
+            count = write(batch)
+            inserted += count
+            skipped += len(batch) - count
+    finally:
+        # Rebuild deferred indexes even if the load stopped part way
+        for sql in index_sql:
+            conn.execute(sql)
+        conn.close()
+    return inserted, invalid, skipped, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load comments or users from JSONL or CSV.")
+    parser.add_argument('path')
+    parser.add_argument('--table', choices=sorted(TABLES), default='comments')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None, help="defaults to the file extension")
+    parser.add_argument('--database', default=DATABASE_PATH)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="drop non-unique indexes during the load and rebuild them once at the end")
+    args = parser.parse_args(argv)
+
+    inserted, invalid, skipped, elapsed = bulk_import(args.path, args.table, args.format, args.database,
+                                                      args.batch_size, args.defer_indexes)
+    rate = inserted / elapsed if elapsed else 0.0
+    print(f"Inserted {inserted} {args.table} rows in {elapsed:.1f}s ({rate:.0f} rows/sec); "
+          f"{invalid} invalid, {skipped} skipped")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,103 +1,809 @@
+import atexit
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 
-def create_connection():
-    return sqlite3.connect('database.db')
+DATABASE_PATH = 'database.db'
+POOL_SIZE = 4
+POOL_TIMEOUT = 30.0
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA sets applied once to every new connection rather than on each query.
+# 'wal' lets readers in other sessions carry on while a comment is committed and
+# only fsyncs at checkpoints; 'rollback' keeps SQLite's journal_mode=delete.
+STORAGE_PROFILES = {
+    'wal': (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -16000),  # negative means KiB, so 16 MB per connection
+        ('mmap_size', 256 * 1024 * 1024),
+        ('busy_timeout', 5000),
+        ('temp_store', 'MEMORY'),
+        ('foreign_keys', 'ON'),
+    ),
+    'rollback': (
+        ('journal_mode', 'DELETE'),
+        ('synchronous', 'FULL'),
+        ('busy_timeout', 5000),
+        ('foreign_keys', 'ON'),
+    ),
+}
+STORAGE_PROFILE = 'wal'
+
+def create_connection(path=DATABASE_PATH, profile=None, **kwargs):
+    conn = sqlite3.connect(path, **kwargs)
+    for name, value in STORAGE_PROFILES[profile or STORAGE_PROFILE]:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections. Streamlit runs every rerun of the script on
+    a fresh thread, so connections are handed between threads instead of being
+    tied to one; each is only ever used by one thread at a time.
+    """
+
+    def __init__(self, path=DATABASE_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connect(self):
+        conn = create_connection(self.path, check_same_thread=False)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(f"no free connection to {self.path} after {self.timeout}s")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                # Never hand out a connection with a half-finished transaction
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._idle = queue.LifoQueue()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=DATABASE_PATH):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+def pooled_connection(path=DATABASE_PATH):
+    return get_pool(path).connection()
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+USERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        email TEXT NOT NULL
+    )
+'''
+
+COMMENTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS comments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        comment TEXT NOT NULL,
+        sentiment TEXT NOT NULL,
+        origin_city TEXT NOT NULL,
+        origin_area TEXT NOT NULL,
+        destination_city TEXT NOT NULL,
+        destination_area TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
 
 def create_users_table():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            email TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute(USERS_TABLE_SQL)
+        conn.commit()
 
 def insert_user(username, password, email):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO users (username, password, email) VALUES (?, ?, ?)
-    ''', (username, password, email))
-    conn.commit()
-    conn.close()
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO users (username, password, email) VALUES (?, ?, ?)
+        ''', (username, password, email))
+        conn.commit()
 
 def authenticate_user(username, password):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        SELECT * FROM users WHERE username = ? AND password = ?
-    ''', (username, password))
-    user = c.fetchone()
-    conn.close()
-    return user
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT * FROM users WHERE username = ? AND password = ?
+        ''', (username, password))
+        user = c.fetchone()
+        return user
 
 def reset_password(username, new_password):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        UPDATE users SET password = ? WHERE username = ?
-    ''', (new_password, username))
-    conn.commit()
-    conn.close()
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            UPDATE users SET password = ? WHERE username = ?
+        ''', (new_password, username))
+        conn.commit()
 
 def check_user_exists(username):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        SELECT * FROM users WHERE username = ?
-    ''', (username,))
-    user = c.fetchone()
-    conn.close()
-    return user is not None
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT * FROM users WHERE username = ?
+        ''', (username,))
+        user = c.fetchone()
+        return user is not None
 
 def create_comments_table():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            comment TEXT NOT NULL,
-            sentiment TEXT NOT NULL,
-            origin_city TEXT NOT NULL,
-            origin_area TEXT NOT NULL,
-            destination_city TEXT NOT NULL,
-            destination_area TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def insert_comment(name, comment, sentiment, origin_city, origin_area, destination_city, destination_area):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area) VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area))
-    conn.commit()
-    conn.close()
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute(COMMENTS_TABLE_SQL)
+        conn.commit()
+
+# The label code is looked up from sentiment_labels using the sentiment text (?3)
+INSERT_COMMENT_SQL = '''
+    INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+                          neg, neu, pos, compound, sentiment_code)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT code FROM sentiment_labels WHERE label = ?3))
+'''
+
+def score_values(scores):
+    if scores is None:
+        return (None, None, None, None)
+    return (scores['neg'], scores['neu'], scores['pos'], scores['compound'])
+
+def write_comment_emotions(conn, comment_id, emotion_counts):
+    """
+    Store a comment's emotion counts inside the caller's transaction, adding any
+    emotion names not yet in the emotions dictionary.
+    """
+    if not emotion_counts:
+        return
+    conn.executemany('''
+        INSERT OR IGNORE INTO emotions (name) VALUES (?)
+    ''', [(name,) for name in emotion_counts])
+    conn.executemany('''
+        INSERT INTO comment_emotions (comment_id, emotion_id, count)
+        SELECT ?, id, ? FROM emotions WHERE name = ?
+    ''', [(comment_id, count, name) for name, count in emotion_counts.items()])
+
+def insert_comment(name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+                   scores=None, emotions=None):
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute(INSERT_COMMENT_SQL, (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+                                       *score_values(scores)))
+        write_comment_emotions(conn, c.lastrowid, emotions)
+        conn.commit()
+
+_STOP = object()
+
+class CommentWriter:
+    """
+    Write-behind queue for comments. submit() returns as soon as the row is queued;
+    a background thread inserts queued rows, with their emotion counts, in one
+    transaction per batch once batch_size rows are waiting or the oldest has
+    waited flush_interval seconds. When the queue is full submit() blocks,
+    pushing back on callers.
+
+    A batch that fails is retried up to retries times, then written row by row so
+    a bad row loses only itself. Rows that still fail are logged and kept in
+    failed_rows for inspection or resubmission.
+    """
+
+    def __init__(self, path=DATABASE_PATH, max_queue=1000, batch_size=100, flush_interval=0.5, retries=2,
+                 retry_delay=0.5, max_failed_rows=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.failed_rows = deque(maxlen=max_failed_rows)
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            'written': 0,
+            'failed': 0,
+            'flushes': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'last_error': None,
+        }
+        self._thread = threading.Thread(target=self._run, name='CommentWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+               scores=None, emotions=None, timeout=None):
+        params = (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+                  *score_values(scores))
+        self._queue.put((params, emotions), timeout=timeout)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
+
+    def close(self, timeout=None):
+        """
+        Write everything still queued, then stop the background thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                if batch:
+                    self._flush(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+    def _write(self, batch):
+        with pooled_connection(self.path) as conn:
+            with conn:
+                for params, emotions in batch:
+                    comment_id = conn.execute(INSERT_COMMENT_SQL, params).lastrowid
+                    write_comment_emotions(conn, comment_id, emotions)
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        failed = []
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                self._write(batch)
+                break
+            except sqlite3.Error as e:
+                error = e
+        else:
+            # Isolate the rows that cannot be written so the rest of the batch is kept
+            for item in batch:
+                try:
+                    self._write([item])
+                except sqlite3.Error as e:
+                    error = e
+                    failed.append(item)
+                    logger.error("Could not write comment %r: %r", item, e)
+            self.failed_rows.extend(failed)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats = self._stats
+            stats['written'] += len(batch) - len(failed)
+            if failed:
+                stats['failed'] += len(failed)
+                stats['last_error'] = repr(error)
+            stats['flushes'] += 1
+            stats['last_flush_seconds'] = elapsed
+            stats['max_flush_seconds'] = max(stats['max_flush_seconds'], elapsed)
+
+_writers = {}
+
+def get_comment_writer(path=DATABASE_PATH):
+    with _pools_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = CommentWriter(path)
+            atexit.register(writer.close)
+        return writer
+
+def insert_comment_async(name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+                         scores=None, emotions=None):
+    get_comment_writer().submit(name, comment, sentiment, origin_city, origin_area, destination_city,
+                                destination_area, scores, emotions)
 
 def get_all_comments():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute('''
-        SELECT * FROM comments ORDER BY timestamp DESC
-    ''')
-    comments = c.fetchall()
-    conn.close()
-    return comments
+    return list(iter_comments())
+
+# Filters accepted by get_comments_page and iter_comments; since/until bound the
+# timestamp as [since, until)
+COMMENT_FILTERS = {
+    'name': 'name = ?',
+    'sentiment': 'sentiment = ?',
+    'origin_city': 'origin_city = ?',
+    'origin_area': 'origin_area = ?',
+    'since': 'timestamp >= ?',
+    'until': 'timestamp < ?',
+}
+
+def _comment_filter_clauses(filters):
+    clauses = []
+    params = []
+    for key, value in (filters or {}).items():
+        if key not in COMMENT_FILTERS:
+            raise ValueError(f"Unknown comment filter {key!r}, expected one of {sorted(COMMENT_FILTERS)}")
+        if value is not None:
+            clauses.append(COMMENT_FILTERS[key])
+            params.append(value)
+    return clauses, params
+
+def get_comments_page(after_cursor=None, limit=100, filters=None):
+    """
+    Return (rows, next_cursor) for one page of comments, newest first. Pages are
+    keyed on (timestamp, id) rather than OFFSET, so each page costs the same however
+    deep it is. Pass next_cursor back to get the following page; it is None once the
+    last page has been returned.
+    """
+    clauses, params = _comment_filter_clauses(filters)
+    if after_cursor is not None:
+        clauses.append('(timestamp, id) < (?, ?)')
+        params.extend(after_cursor)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT * FROM comments {where} ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (*params, limit))
+        comments = c.fetchall()
+        columns = [column[0] for column in c.description]
+    if len(comments) < limit:
+        return comments, None
+    last = comments[-1]
+    return comments, (last[columns.index('timestamp')], last[columns.index('id')])
+
+def get_sentiment_summary(filters=None):
+    """
+    Return (label, comments, mean compound score) per stress label, most stressed
+    first, over the comments matching filters.
+    """
+    clauses, params = _comment_filter_clauses(filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT l.label, s.comments, s.mean_compound
+            FROM (
+                SELECT sentiment_code, COUNT(*) AS comments, AVG(compound) AS mean_compound
+                FROM comments {where}
+                GROUP BY sentiment_code
+            ) AS s
+            JOIN sentiment_labels AS l ON l.code = s.sentiment_code
+            ORDER BY l.code DESC
+        ''', params)
+        return c.fetchall()
+
+def get_top_emotions_by_area(days=30, limit=5):
+    """
+    Return (origin_area, emotion, total count) for the limit most frequent emotions
+    per origin area over comments from the last days days.
+    """
+    # CROSS JOIN pins comments as the outer loop, so only the time range is read
+    # through comments_timestamp_area. Without ANALYZE statistics the planner would
+    # otherwise scan every comment_emotions row and look each comment up.
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT origin_area, emotion, total FROM (
+                SELECT c.origin_area, e.name AS emotion, SUM(ce.count) AS total,
+                       ROW_NUMBER() OVER (PARTITION BY c.origin_area ORDER BY SUM(ce.count) DESC) AS rank
+                FROM comments AS c
+                CROSS JOIN comment_emotions AS ce ON ce.comment_id = c.id
+                JOIN emotions AS e ON e.id = ce.emotion_id
+                WHERE c.timestamp >= datetime('now', ?)
+                GROUP BY c.origin_area, ce.emotion_id
+            )
+            WHERE rank <= ?
+            ORDER BY origin_area, total DESC
+        ''', (f'-{int(days)} days', limit))
+        return c.fetchall()
+
+def iter_comments(filters=None, page_size=500):
+    """
+    Stream comments newest first, one page in memory at a time. No connection is
+    held while the caller consumes a page.
+    """
+    cursor = None
+    while True:
+        comments, cursor = get_comments_page(cursor, page_size, filters)
+        yield from comments
+        if cursor is None:
+            return
 
 def clear_database():
-    conn = create_connection()
-    c = conn.cursor()
-    # Delete all records from users and comments tables
-    c.execute('DELETE FROM users')
-    c.execute('DELETE FROM comments')
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        # Delete all records from users and comments tables
+        c.execute('DELETE FROM users')
+        c.execute('DELETE FROM comments')
+        conn.commit()
+
+# Rollup buckets (strftime formats) and the comment column each dimension groups by
+ROLLUP_BUCKETS = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d'}
+ROLLUP_DIMENSIONS = {'user': 'name', 'area': 'origin_area'}
+
+def _rollup_add_sql(row):
+    # Count a comment (NEW or OLD inside a trigger) into each of its rollup rows
+    return ''.join(f'''
+            INSERT INTO comment_rollups (granularity, dimension, key, bucket, comments, compound_sum, scored)
+            VALUES ('{granularity}', '{dimension}', {row}.{column}, strftime('{bucket}', {row}.timestamp),
+                    1, COALESCE({row}.compound, 0), {row}.compound IS NOT NULL)
+            ON CONFLICT (granularity, dimension, key, bucket) DO UPDATE SET
+                comments = comments + 1,
+                compound_sum = compound_sum + excluded.compound_sum,
+                scored = scored + excluded.scored;'''
+        for granularity, bucket in ROLLUP_BUCKETS.items()
+        for dimension, column in ROLLUP_DIMENSIONS.items())
+
+def _rollup_remove_sql(row):
+    return ''.join(f'''
+            UPDATE comment_rollups SET
+                comments = comments - 1,
+                compound_sum = compound_sum - COALESCE({row}.compound, 0),
+                scored = scored - ({row}.compound IS NOT NULL)
+            WHERE granularity = '{granularity}' AND dimension = '{dimension}' AND key = {row}.{column}
+                AND bucket = strftime('{bucket}', {row}.timestamp);'''
+        for granularity, bucket in ROLLUP_BUCKETS.items()
+        for dimension, column in ROLLUP_DIMENSIONS.items())
+
+def _rollup_backfill_sql():
+    return [f'''
+        INSERT INTO comment_rollups (granularity, dimension, key, bucket, comments, compound_sum, scored)
+        SELECT '{granularity}', '{dimension}', {column}, strftime('{bucket}', timestamp),
+               COUNT(*), COALESCE(SUM(compound), 0), COUNT(compound)
+        FROM comments
+        GROUP BY {column}, strftime('{bucket}', timestamp)
+    ''' for granularity, bucket in ROLLUP_BUCKETS.items() for dimension, column in ROLLUP_DIMENSIONS.items()]
+
+def get_stress_trend(granularity='day', dimension='area', key=None, since=None):
+    """
+    Return (bucket, key, comments, mean compound score) rows from the rollups,
+    oldest bucket first. Reads only pre-aggregated rows, never the comments table.
+    """
+    if granularity not in ROLLUP_BUCKETS or dimension not in ROLLUP_DIMENSIONS:
+        raise ValueError(f"Unknown rollup {granularity!r}/{dimension!r}")
+    clauses = ['granularity = ?', 'dimension = ?', 'comments > 0']
+    params = [granularity, dimension]
+    if key is not None:
+        clauses.append('key = ?')
+        params.append(key)
+    if since is not None:
+        clauses.append('bucket >= ?')
+        params.append(since)
+    with pooled_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT bucket, key, comments, compound_sum / NULLIF(scored, 0)
+            FROM comment_rollups
+            WHERE {' AND '.join(clauses)}
+            ORDER BY bucket, key
+        ''', params)
+        return c.fetchall()
+
+def quote_search_terms(query):
+    """
+    Turn free text into an FTS5 query matching every word, each quoted so
+    apostrophes, hyphens and operators like OR or NEAR are searched as text.
+    """
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+def search_comments(query, limit=20, filters=None, raw=False, path=DATABASE_PATH):
+    """
+    Full-text search over comment transcripts, best BM25 match first. Returns
+    (id, name, timestamp, sentiment, snippet) with matches in the snippet wrapped
+    in [ ]. query is plain text matching comments containing every word; with
+    raw=True it uses FTS5 syntax, e.g. '"fertilizer price" OR locust', and a
+    malformed query raises ValueError.
+    """
+    match = query if raw else quote_search_terms(query)
+    if not match:
+        return []
+    clauses, params = _comment_filter_clauses(filters)
+    where = ''.join(f' AND c.{clause}' for clause in clauses)
+    with pooled_connection(path) as conn:
+        c = conn.cursor()
+        try:
+            c.execute(f'''
+                SELECT c.id, c.name, c.timestamp, c.sentiment,
+                       snippet(comments_fts, 0, '[', ']', '...', 12)
+                FROM comments_fts
+                JOIN comments AS c ON c.id = comments_fts.rowid
+                WHERE comments_fts MATCH ?{where}
+                ORDER BY bm25(comments_fts)
+                LIMIT ?
+            ''', (match, *params, limit))
+        except sqlite3.OperationalError as e:
+            if not raw:
+                raise
+            raise ValueError(f"Invalid search query {query!r}: {e}") from e
+        return c.fetchall()
+
+def rebuild_search_index(path=DATABASE_PATH):
+    """
+    Rebuild the full-text index from the comments table, then merge its segments.
+    """
+    with pooled_connection(path) as conn:
+        with conn:
+            conn.execute("INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')")
+    optimize_search_index(path)
+
+def optimize_search_index(path=DATABASE_PATH):
+    with pooled_connection(path) as conn:
+        with conn:
+            conn.execute("INSERT INTO comments_fts (comments_fts) VALUES ('optimize')")
+
+def get_cached_transcript(key, min_created_at, path=DATABASE_PATH):
+    with pooled_connection(path) as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT transcript FROM transcript_cache WHERE key = ? AND created_at >= ?
+        ''', (key, min_created_at))
+        row = c.fetchone()
+        return row[0] if row else None
+
+def put_cached_transcript(key, transcript, created_at, min_created_at, max_rows, path=DATABASE_PATH):
+    """
+    Store a transcript, then evict expired entries and the oldest beyond max_rows.
+    Returns the number of entries evicted.
+    """
+    with pooled_connection(path) as conn:
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO transcript_cache (key, transcript, created_at) VALUES (?, ?, ?)
+            ''', (key, transcript, created_at))
+            evicted = conn.execute('''
+                DELETE FROM transcript_cache WHERE created_at < ? OR key IN (
+                    SELECT key FROM transcript_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (min_created_at, max_rows)).rowcount
+        return evicted
+
+def _username_unique_indexes(conn):
+    indexes = []
+    for _, name, unique, *_ in conn.execute('PRAGMA index_list(users)').fetchall():
+        columns = [row[2] for row in conn.execute(f'PRAGMA index_info("{name}")')]
+        if unique and columns == ['username']:
+            indexes.append(name)
+    return indexes
+
+def _create_username_index(conn):
+    """
+    Add a unique username index unless the users table already has one, as it
+    does when it was created with the UNIQUE constraint.
+    """
+    if not _username_unique_indexes(conn):
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username)')
+
+def _drop_duplicate_username_index(conn):
+    if set(_username_unique_indexes(conn)) - {'users_username'}:
+        conn.execute('DROP INDEX IF EXISTS users_username')
+
+# Schema migrations, applied in order and tracked in PRAGMA user_version. Entry N
+# (1-based) upgrades a database at version N-1; append new entries, never edit old ones.
+# A step is an SQL statement, or a function of the connection for a step that
+# depends on the existing schema.
+MIGRATIONS = [
+    # 1: baseline tables
+    (USERS_TABLE_SQL, COMMENTS_TABLE_SQL),
+    # 2: enforce unique usernames. Databases created before the UNIQUE constraint
+    # may hold repeats; the earliest registration of each username is kept and the
+    # later ones are moved to users_duplicates for a manual merge.
+    (
+        'CREATE TABLE IF NOT EXISTS users_duplicates AS SELECT * FROM users WHERE 0',
+        '''
+        INSERT INTO users_duplicates
+        SELECT * FROM users WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY username)
+        ''',
+        'DELETE FROM users WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY username)',
+        _create_username_index,
+    ),
+    # 3: per-user and global comment timelines. comments_timestamp is a prefix of
+    # comments_timestamp_scores and comments_timestamp_area but is kept: its entries
+    # are ordered by (timestamp, id), which the keyset pages of get_comments_page
+    # read without a sort; the wider indexes order by their extra columns instead.
+    (
+        'CREATE INDEX IF NOT EXISTS comments_name_timestamp ON comments (name, timestamp)',
+        'CREATE INDEX IF NOT EXISTS comments_timestamp ON comments (timestamp)',
+    ),
+    # 4: raw VADER scores and an integer label code, so dashboards aggregate numbers
+    # instead of comparing label strings. Codes order labels by stress level.
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS sentiment_labels (
+            code INTEGER PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO sentiment_labels (code, label)
+        VALUES (0, 'Low Stress'), (1, 'Neutral Stress Level'), (2, 'High Stress')
+        ''',
+        'ALTER TABLE comments ADD COLUMN neg REAL',
+        'ALTER TABLE comments ADD COLUMN neu REAL',
+        'ALTER TABLE comments ADD COLUMN pos REAL',
+        'ALTER TABLE comments ADD COLUMN compound REAL',
+        'ALTER TABLE comments ADD COLUMN sentiment_code INTEGER REFERENCES sentiment_labels (code)',
+        'UPDATE comments SET sentiment_code = (SELECT code FROM sentiment_labels WHERE label = comments.sentiment)',
+        'CREATE INDEX IF NOT EXISTS comments_timestamp_scores ON comments (timestamp, sentiment_code, compound)',
+    ),
+    # 5: per-comment emotion counts, normalized against an emotion dictionary
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS emotions (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS comment_emotions (
+            comment_id INTEGER NOT NULL REFERENCES comments (id) ON DELETE CASCADE,
+            emotion_id INTEGER NOT NULL REFERENCES emotions (id),
+            count INTEGER NOT NULL,
+            PRIMARY KEY (comment_id, emotion_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS comment_emotions_emotion ON comment_emotions (emotion_id, comment_id, count)',
+        'CREATE INDEX IF NOT EXISTS comments_timestamp_area ON comments (timestamp, origin_area)',
+    ),
+    # 6: hourly and daily comment counts and compound score sums per user and per
+    # origin area, kept current by triggers so trend charts never scan comments
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS comment_rollups (
+            granularity TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            comments INTEGER NOT NULL,
+            compound_sum REAL NOT NULL,
+            scored INTEGER NOT NULL,
+            PRIMARY KEY (granularity, dimension, key, bucket)
+        ) WITHOUT ROWID
+        ''',
+        *_rollup_backfill_sql(),
+        f'''
+        CREATE TRIGGER IF NOT EXISTS comments_rollup_insert AFTER INSERT ON comments BEGIN
+            {_rollup_add_sql('NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS comments_rollup_delete AFTER DELETE ON comments BEGIN
+            {_rollup_remove_sql('OLD')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS comments_rollup_update
+        AFTER UPDATE OF name, origin_area, timestamp, compound ON comments BEGIN
+            {_rollup_remove_sql('OLD')}
+            {_rollup_add_sql('NEW')}
+        END
+        ''',
+    ),
+    # 7: external-content full-text index over comment transcripts
+    (
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+            comment, content='comments', content_rowid='id', tokenize='porter unicode61'
+        )
+        ''',
+        "INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+            INSERT INTO comments_fts (rowid, comment) VALUES (NEW.id, NEW.comment);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+            INSERT INTO comments_fts (comments_fts, rowid, comment) VALUES ('delete', OLD.id, OLD.comment);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF comment ON comments BEGIN
+            INSERT INTO comments_fts (comments_fts, rowid, comment) VALUES ('delete', OLD.id, OLD.comment);
+            INSERT INTO comments_fts (rowid, comment) VALUES (NEW.id, NEW.comment);
+        END
+        ''',
+    ),
+    # 8: speech recognition results keyed by audio fingerprint, backend and language
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS transcript_cache (
+            key TEXT PRIMARY KEY,
+            transcript TEXT NOT NULL,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS transcript_cache_created_at ON transcript_cache (created_at)',
+    ),
+    # 9: background transcription jobs; audio is cleared once a job finishes
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            status TEXT NOT NULL,
+            audio BLOB,
+            sample_rate INTEGER NOT NULL,
+            sample_width INTEGER NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)',
+    ),
+    # 10: databases migrated before step 2 checked for the UNIQUE constraint carry
+    # users_username next to it; drop the duplicate
+    (_drop_duplicate_username_index,),
+]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(path=DATABASE_PATH):
+    """
+    Bring the database up to the latest schema version and return that version.
+    Each migration commits on its own, so an interrupted run resumes where it stopped.
+    """
+    with pooled_connection(path) as conn:
+        while True:
+            # Take the write lock before reading the version so concurrent starters
+            # cannot apply the same migration twice
+            conn.execute('BEGIN IMMEDIATE')
+            version = schema_version(conn)
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return version
+            for statement in MIGRATIONS[version]:
+                if callable(statement):
+                    statement(conn)
+                    continue
+                removed = conn.execute(statement).rowcount
+                if removed > 0 and statement.lstrip().upper().startswith('DELETE'):
+                    logger.warning("Migration %d removed %d rows: %s", version + 1, removed, statement)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
@@ -0,0 +1,283 @@
+"""
+Background transcription jobs, so a Streamlit script run never waits on speech
+recognition. Submitting a recording records the job in the jobs table, keeps the
+audio in memory and returns the job id at once; worker threads transcribe and
+analyze it, and the UI polls JobQueue.status() until the job finishes.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import speech_recognition as sr
+
+from audio import normalize_audio, trim_silence
+from database import DATABASE_PATH, insert_comment_async, pooled_connection
+from speech import get_backend, transcribe_chunked
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMED_OUT = 'timed_out'
+FINISHED = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def describe_error(error):
+    if isinstance(error, sr.UnknownValueError):
+        return "Speech Recognition could not understand the audio."
+    if isinstance(error, sr.RequestError):
+        return f"Could not request results from Speech Recognition service: {error}"
+    return f"{type(error).__name__}: {error}"
+
+
+def analyze_recording(audio_data, pipeline, cache=None, backend=None, stop=None):
+    captured_bytes = len(audio_data.frame_data)
+    start = time.perf_counter()
+    # Recognition needs no more than 16 kHz mono, and silence costs ASR time and
+    # quota without adding words, so shrink the payload before sending it
+    audio_data = normalize_audio(audio_data)
+    audio_data, silence_seconds = trim_silence(audio_data)
+    prepare_seconds = time.perf_counter() - start
+    if audio_data is None:
+        raise sr.UnknownValueError()
+    # Long voice notes are transcribed as pause-aligned chunks in parallel, so a
+    # 10 minute note takes about as long as its slowest chunk
+    comment, chunks = transcribe_chunked(get_backend(backend), audio_data, cache, stop=stop)
+    result = pipeline.analyze(comment)
+    return {
+        'comment': comment,
+        'sentiment': result.sentiment,
+        'scores': result.scores,
+        'emotions': dict(result.emotions),
+        'silence_seconds': silence_seconds,
+        'captured_bytes': captured_bytes,
+        'payload_bytes': len(audio_data.frame_data),
+        'prepare_seconds': prepare_seconds,
+        'chunks': chunks,
+    }
+
+
+def save_analysis(job, result):
+    insert_comment_async(job['username'], result['comment'], result['sentiment'], "Unknown", "Unknown", "Unknown",
+                         "Unknown", result['scores'], result['emotions'])
+
+
+class JobQueue:
+    """
+    Bounded queue of recordings worked by a pool of threads. handler(audio_data, stop)
+    returns a JSON-serializable result; on_done(job, result) runs once the job is
+    recorded as done, so a job cancelled mid-run has no side effects. A job still
+    running after timeout seconds is marked timed out and its result discarded.
+
+    Cancelling or timing out a job frees its worker at once and sets the stop event
+    passed to the handler, which should give up as soon as it can. Handlers still
+    running after that are counted, and submit() refuses new jobs while
+    max_abandoned of them are alive.
+    """
+
+    def __init__(self, handler, on_done=None, path=DATABASE_PATH, workers=2, max_pending=20, timeout=120.0,
+                 max_abandoned=4):
+        self.handler = handler
+        self.on_done = on_done
+        self.path = path
+        self.timeout = timeout
+        self.max_abandoned = max_abandoned
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._running = {}
+        self._abandoned = []
+        # Recordings wait in memory rather than in the jobs table; queued jobs do not
+        # survive a restart anyway, and writing tens of MB would stall submit()
+        self._audio = {}
+        self._abandon_unfinished()
+        self._threads = [threading.Thread(target=self._work, name=f'JobWorker-{n}', daemon=True)
+                         for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _abandon_unfinished(self):
+        # Jobs from a previous server process lost their place in the in-memory queue
+        with pooled_connection(self.path) as conn:
+            with conn:
+                conn.execute('''
+                    UPDATE jobs SET status = ?, error = 'Interrupted by a server restart.', audio = NULL,
+                                    finished_at = ?
+                    WHERE status IN (?, ?)
+                ''', (FAILED, time.time(), QUEUED, RUNNING))
+
+    def submit(self, username, audio_data):
+        """
+        Queue a recording and return its job id. Raises JobQueueFull instead of
+        blocking when max_pending jobs are already waiting or too many abandoned
+        handlers are still running.
+        """
+        if self._queue.full() or self._abandoned_count() >= self.max_abandoned:
+            raise JobQueueFull()
+        with pooled_connection(self.path) as conn:
+            with conn:
+                job_id = conn.execute('''
+                    INSERT INTO jobs (username, status, sample_rate, sample_width, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (username, QUEUED, audio_data.sample_rate, audio_data.sample_width, time.time())).lastrowid
+        with self._lock:
+            self._audio[job_id] = audio_data
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            with self._lock:
+                del self._audio[job_id]
+            with pooled_connection(self.path) as conn:
+                with conn:
+                    conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            raise JobQueueFull()
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job. Returns False if it had already finished.
+        """
+        if not self._finish(job_id, CANCELLED, from_status=(QUEUED, RUNNING)):
+            return False
+        with self._lock:
+            self._audio.pop(job_id, None)
+            running = self._running.get(job_id)
+        if running is not None:
+            stop, wake = running
+            stop.set()
+            wake.set()
+        return True
+
+    def status(self, job_id):
+        """
+        Return the job as a dict without its audio, with result decoded, or None.
+        """
+        with pooled_connection(self.path) as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT id, username, status, result, error, created_at, started_at, finished_at
+                FROM jobs WHERE id = ?
+            ''', (job_id,))
+            row = c.fetchone()
+            columns = [column[0] for column in c.description]
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def metrics(self):
+        return {'queue_depth': self._queue.qsize(), 'max_pending': self._queue.maxsize,
+                'abandoned': self._abandoned_count()}
+
+    def _abandoned_count(self):
+        with self._lock:
+            self._abandoned = [runner for runner in self._abandoned if runner.is_alive()]
+            return len(self._abandoned)
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _finish(self, job_id, status, result=None, error=None, from_status=(RUNNING,)):
+        placeholders = ', '.join('?' * len(from_status))
+        with pooled_connection(self.path) as conn:
+            with conn:
+                updated = conn.execute(f'''
+                    UPDATE jobs SET status = ?, result = ?, error = ?, audio = NULL, finished_at = ?
+                    WHERE id = ? AND status IN ({placeholders})
+                ''', (status, json.dumps(result) if result is not None else None, error, time.time(), job_id,
+                      *from_status)).rowcount
+        return updated == 1
+
+    def _claim(self, job_id):
+        with pooled_connection(self.path) as conn:
+            with conn:
+                claimed = conn.execute('''
+                    UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?
+                ''', (RUNNING, time.time(), job_id, QUEUED)).rowcount
+                if not claimed:
+                    return None
+                c = conn.cursor()
+                c.execute('''
+                    SELECT id, username, sample_rate, sample_width FROM jobs WHERE id = ?
+                ''', (job_id,))
+                columns = [column[0] for column in c.description]
+                return dict(zip(columns, c.fetchone()))
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is _STOP:
+                return
+            # A database error must not kill the worker or leave the job running
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                try:
+                    self._finish(job_id, FAILED, error=describe_error(e), from_status=(QUEUED, RUNNING))
+                except Exception:
+                    logger.exception("Could not mark job %s as failed", job_id)
+
+    def _run(self, job_id):
+        stop = threading.Event()
+        wake = threading.Event()
+        # Registered before the claim so a cancel arriving at any point wakes the worker
+        with self._lock:
+            self._running[job_id] = (stop, wake)
+        try:
+            job = self._claim(job_id)
+            with self._lock:
+                audio_data = self._audio.pop(job_id, None)
+            if job is None:
+                return  # cancelled while queued
+            if audio_data is None:
+                raise RuntimeError("The recording for this job is no longer available.")
+            outcome = {}
+
+            def run():
+                try:
+                    outcome['result'] = self.handler(audio_data, stop)
+                except Exception as e:
+                    outcome['error'] = e
+                finally:
+                    wake.set()
+
+            # The handler runs on its own thread so a hung recognizer call cannot hold
+            # this worker past the timeout or a cancel; its late result is simply dropped
+            runner = threading.Thread(target=run, name=f'Job-{job_id}', daemon=True)
+            runner.start()
+            wake.wait(self.timeout)
+        finally:
+            with self._lock:
+                del self._running[job_id]
+        if runner.is_alive():
+            stop.set()
+            with self._lock:
+                self._abandoned.append(runner)
+            self._finish(job_id, TIMED_OUT, error=f"Timed out after {self.timeout:.0f}s.")
+        elif 'error' in outcome:
+            self._finish(job_id, FAILED, error=describe_error(outcome['error']))
+        elif self._finish(job_id, DONE, result=outcome['result']) and self.on_done is not None:
+            try:
+                self.on_done(job, outcome['result'])
+            except Exception as e:
+                self._record_error(job_id, describe_error(e))
+
+    def _record_error(self, job_id, error):
+        with pooled_connection(self.path) as conn:
+            with conn:
+                conn.execute('UPDATE jobs SET error = ? WHERE id = ?', (error, job_id))
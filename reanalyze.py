@@ -0,0 +1,104 @@
+"""
+Re-score the comments table outside the Streamlit UI.
+
+    python reanalyze.py --workers 8 --chunk-size 500
+
+Rows are read in id order, scored by a pool of worker processes that each warm
+one AnalysisPipeline, and written back (stress label, raw VADER scores and
+emotion counts) one transaction per chunk.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from analysis import AnalysisPipeline, TOKENIZERS
+from database import DATABASE_PATH, create_connection, migrate, score_values, \
+    write_comment_emotions
+
+_pipeline = None
+
+
+def _init_worker(tokenizer):
+    global _pipeline
+    _pipeline = AnalysisPipeline(tokenizer=tokenizer)
+
+
+def score_chunk(rows):
+    scores = []
+    for comment_id, comment in rows:
+        result = _pipeline.analyze(comment)
+        scores.append(((result.sentiment, *score_values(result.scores), comment_id), dict(result.emotions)))
+    return scores
+
+
+def iter_chunks(conn, chunk_size):
+    # Keyset paging on id keeps no read cursor open while chunks are written back
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, comment FROM comments WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def write_scores(conn, scores):
+    with conn:
+        conn.executemany('''
+            UPDATE comments
+            SET sentiment = ?1, neg = ?2, neu = ?3, pos = ?4, compound = ?5,
+                sentiment_code = (SELECT code FROM sentiment_labels WHERE label = ?1)
+            WHERE id = ?6
+        ''', [params for params, _ in scores])
+        conn.executemany('''
+            DELETE FROM comment_emotions WHERE comment_id = ?
+        ''', [(params[-1],) for params, _ in scores])
+        for params, emotions in scores:
+            write_comment_emotions(conn, params[-1], emotions)
+    return len(scores)
+
+
+def reanalyze(path=DATABASE_PATH, workers=None, chunk_size=500, tokenizer="nltk"):
+    """
+    Score every comment and return (rows processed, elapsed seconds).
+    """
+    workers = workers or os.cpu_count() or 1
+    migrate(path)
+    conn = create_connection(path)
+    processed = 0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(tokenizer,)) as executor:
+            pending = set()
+            for rows in iter_chunks(conn, chunk_size):
+                pending.add(executor.submit(score_chunk, rows))
+                # Bound the chunks in flight so memory stays flat on large tables
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        processed += write_scores(conn, future.result())
+            for future in pending:
+                processed += write_scores(conn, future.result())
+    finally:
+        conn.close()
+    return processed, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score historical comments.")
+    parser.add_argument('--database', default=DATABASE_PATH)
+    parser.add_argument('--workers', type=int, default=None, help="defaults to the CPU count")
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--tokenizer', choices=sorted(TOKENIZERS), default="nltk")
+    args = parser.parse_args(argv)
+
+    processed, elapsed = reanalyze(args.database, args.workers, args.chunk_size, args.tokenizer)
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"Scored {processed} comments in {elapsed:.1f}s ({rate:.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Maintain the full-text index over comment transcripts.
+
+    python search_index.py rebuild
+    python search_index.py optimize
+"""
+import argparse
+import time
+
+from database import DATABASE_PATH, migrate, optimize_search_index, rebuild_search_index
+
+COMMANDS = {
+    'rebuild': rebuild_search_index,
+    'optimize': optimize_search_index,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild or optimize the comment search index.")
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--database', default=DATABASE_PATH)
+    args = parser.parse_args(argv)
+
+    migrate(args.database)
+    start = time.perf_counter()
+    COMMANDS[args.command](args.database)
+    print(f"{args.command.capitalize()} finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
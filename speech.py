@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import speech_recognition as sr
+
+from audio import split_at_pauses
+from database import DATABASE_PATH, get_cached_transcript, put_cached_transcript
+
+# Backend used when none is named; 'vosk' works without internet access. Both can be
+# set through environment variables, and on Streamlit through top-level st.secrets
+# keys, which Streamlit exports as environment variables
+RECOGNIZER_BACKEND = os.environ.get('RECOGNIZER_BACKEND', 'google')
+# Directory of an unpacked Vosk model, e.g. vosk-model-small-en-us
+VOSK_MODEL_PATH = os.environ.get('VOSK_MODEL_PATH', 'model')
+# Long recordings are split into chunks of at most this many seconds and up to
+# CHUNK_WORKERS of them are transcribed at once
+MAX_CHUNK_SECONDS = 30.0
+CHUNK_WORKERS = 4
+CHUNK_RETRIES = 2
+
+
+def transcript_key(audio_data, backend, language):
+    """
+    Fingerprint a recording for the transcript cache: a hash of the raw PCM and its
+    format, plus the recognizer backend and language that produced the text.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{backend}\0{language}\0{audio_data.sample_rate}\0{audio_data.sample_width}\0'.encode())
+    digest.update(audio_data.get_raw_data())
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """
+    Two-tier transcript cache: an in-process LRU in front of the transcript_cache
+    table, so reruns, double clicks and re-submissions of the same recording do
+    not reach the speech recognition service again. Entries expire after ttl
+    seconds in both tiers.
+    """
+
+    def __init__(self, path=DATABASE_PATH, max_entries=256, max_rows=10000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= now - self.ttl:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry[0]
+        transcript = get_cached_transcript(key, now - self.ttl, self.path)
+        with self._lock:
+            if transcript is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['disk_hits'] += 1
+                self._remember(key, transcript, now)
+        return transcript
+
+    def put(self, key, transcript):
+        now = time.time()
+        with self._lock:
+            self._remember(key, transcript, now)
+        evicted = put_cached_transcript(key, transcript, now, now - self.ttl, self.max_rows, self.path)
+        with self._lock:
+            self._stats['disk_evictions'] += evicted
+
+    def _remember(self, key, transcript, stored_at):
+        self._entries[key] = (transcript, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['memory_evictions'] += 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+def audio_duration(audio_data):
+    return len(audio_data.frame_data) / (audio_data.sample_rate * audio_data.sample_width)
+
+
+class RecognizerBackend:
+    """
+    A speech recognizer behind one recognize(audio_data) call. Backends are built
+    once per process, so anything slow to load (models, lexicons) is loaded in
+    __init__. Each call's latency and real-time factor (processing seconds per
+    second of audio) are recorded for metrics().
+    """
+
+    name = None
+
+    def __init__(self, language="en-US"):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'seconds': 0.0, 'audio_seconds': 0.0}
+
+    def recognize(self, audio_data):
+        start = time.perf_counter()
+        try:
+            return self._recognize(audio_data)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats['calls'] += 1
+                self._stats['seconds'] += elapsed
+                self._stats['audio_seconds'] += audio_duration(audio_data)
+
+    def _recognize(self, audio_data):
+        raise NotImplementedError
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mean_latency'] = stats['seconds'] / stats['calls'] if stats['calls'] else 0.0
+        stats['real_time_factor'] = stats['seconds'] / stats['audio_seconds'] if stats['audio_seconds'] else 0.0
+        return stats
+
+
+class GoogleBackend(RecognizerBackend):
+    name = 'google'
+
+    def _recognize(self, audio_data):
+        return self.recognizer.recognize_google(audio_data, language=self.language)
+
+
+class VoskBackend(RecognizerBackend):
+    """
+    Offline CPU recognition with Vosk. The model is loaded once, unlike
+    Recognizer.recognize_vosk which loads it on every call; its language is fixed
+    by the model at model_path.
+    """
+
+    name = 'vosk'
+    sample_rate = 16000
+
+    def __init__(self, language="en-US", model_path=VOSK_MODEL_PATH):
+        super().__init__(language)
+        try:
+            from vosk import KaldiRecognizer, Model
+        except ImportError as e:
+            raise sr.RequestError("the vosk backend needs the vosk package installed") from e
+        self._kaldi_recognizer = KaldiRecognizer
+        try:
+            self.model = Model(model_path)
+        except Exception as e:
+            raise sr.RequestError(f"could not load the Vosk model from {model_path!r}: {e}") from e
+
+    def _recognize(self, audio_data):
+        recognizer = self._kaldi_recognizer(self.model, self.sample_rate)
+        recognizer.AcceptWaveform(audio_data.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        transcript = json.loads(recognizer.FinalResult()).get('text', '')
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class StubBackend(RecognizerBackend):
+    """
+    Deterministic local stand-in for tests and load benchmarks. The same audio
+    always yields the same transcript, and each call takes real_time_factor
+    seconds per second of audio to mimic a real engine.
+    """
+
+    name = 'stub'
+    transcripts = (
+        "the drought has left us with low crop yield this season",
+        "pest infestation destroyed half of the maize farm",
+        "market price drop and loan debt are a heavy burden",
+        "good rain this year and the harvest looks healthy",
+    )
+
+    def __init__(self, language="en-US", real_time_factor=0.0):
+        super().__init__(language)
+        self.real_time_factor = real_time_factor
+
+    def _recognize(self, audio_data):
+        raw_data = audio_data.get_raw_data()
+        if not raw_data.strip(b'\0'):
+            raise sr.UnknownValueError()
+        if self.real_time_factor:
+            time.sleep(audio_duration(audio_data) * self.real_time_factor)
+        index = int.from_bytes(hashlib.sha256(raw_data).digest()[:4], 'big') % len(self.transcripts)
+        return self.transcripts[index]
+
+
+BACKENDS = {backend.name: backend for backend in (GoogleBackend, VoskBackend, StubBackend)}
+
+
+@lru_cache(maxsize=None)
+def _load_backend(name, language):
+    return BACKENDS[name](language)
+
+
+def get_backend(name=None, language="en-US"):
+    """
+    Return the process-wide backend called name, RECOGNIZER_BACKEND by default.
+    """
+    name = name or RECOGNIZER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown recognizer backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return _load_backend(name, language)
+
+
+def transcribe(backend, audio_data, cache=None):
+    """
+    Transcribe audio_data with backend, reusing a cached transcript for the same
+    recording when there is one. Recognition errors are raised as usual and never
+    cached.
+    """
+    key = transcript_key(audio_data, backend.name, backend.language) if cache is not None else None
+    if key is not None:
+        transcript = cache.get(key)
+        if transcript is not None:
+            return transcript
+    transcript = backend.recognize(audio_data)
+    if key is not None:
+        cache.put(key, transcript)
+    return transcript
+
+
+class TranscriptionCancelled(Exception):
+    pass
+
+
+def _transcribe_chunk(backend, chunk, cache, retries, retry_delay, stop):
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        if stop is not None and stop.is_set():
+            raise TranscriptionCancelled()
+        attempts += 1
+        try:
+            transcript = transcribe(backend, chunk, cache)
+            break
+        except sr.UnknownValueError:
+            # A chunk with no recognizable words, e.g. only a cough, adds nothing
+            transcript = None
+            break
+        except sr.RequestError:
+            if attempts > retries:
+                raise
+            delay = retry_delay * 2 ** (attempts - 1)
+            if stop is not None:
+                stop.wait(delay)
+            else:
+                time.sleep(delay)
+    timing = {'audio_seconds': audio_duration(chunk), 'seconds': time.perf_counter() - start, 'attempts': attempts}
+    return transcript, timing
+
+
+def transcribe_chunked(backend, audio_data, cache=None, max_chunk_seconds=MAX_CHUNK_SECONDS,
+                       workers=CHUNK_WORKERS, retries=CHUNK_RETRIES, retry_delay=1.0, stop=None):
+    """
+    Transcribe a long recording as chunks split at pauses, up to workers at a time,
+    and join the transcripts in order. A chunk whose request fails is retried on its
+    own up to retries times. Returns (transcript, per-chunk timings); raises
+    UnknownValueError if no chunk had recognizable speech. Once the stop event is
+    set, chunks not yet sent raise TranscriptionCancelled instead.
+    """
+    chunks = split_at_pauses(audio_data, max_chunk_seconds)
+    if len(chunks) == 1:
+        outcomes = [_transcribe_chunk(backend, chunks[0], cache, retries, retry_delay, stop)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks)), thread_name_prefix='Chunk') as executor:
+            futures = [executor.submit(_transcribe_chunk, backend, chunk, cache, retries, retry_delay, stop)
+                       for chunk in chunks]
+            outcomes = [future.result() for future in futures]
+    transcripts = [transcript for transcript, _ in outcomes if transcript]
+    if not transcripts:
+        raise sr.UnknownValueError()
+    return ' '.join(transcripts), [timing for _, timing in outcomes]
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import close_pools, migrate  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Path of a fully migrated database in a temporary directory.
+    """
+    path = str(tmp_path / 'test.db')
+    migrate(path)
+    yield path
+    close_pools()
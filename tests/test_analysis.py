@@ -0,0 +1,109 @@
+import pytest
+
+import analysis
+from analysis import (LEXICON_PATH, NEGATIONS, AnalysisPipeline, clean_text, fast_tokenize, get_sentiment_analyzer,
+                      get_stop_words, nltk_tokenize, parse_lexicon, sentiment_analysis, sentiment_analysis_batch,
+                      stress_label, tokenize_and_filter)
+
+COMMENTS = [
+    "Vehicles moved at a snail’s pace, forming a long snaking line.",
+    "I cannot afford “fertilizer” this season — we’re gonna lose the farm…",
+    "Gimme a loan, lemme plant; we wanna harvest and we gotta sell.",
+    "Farmers' co-op prices rose 20% in 2024/05 (again!) & nobody said why?",
+    "The naïve hope: rain – then pests ‘everywhere’.",
+    "Low crop yield, drought, and market price drop « are » heavy burdens.",
+]
+
+
+def lexicon_terms():
+    with open(LEXICON_PATH, 'r', encoding='utf-8') as file:
+        return [term for term, _ in parse_lexicon(file)]
+
+
+@pytest.fixture(scope='module')
+def pipeline():
+    return AnalysisPipeline()
+
+
+def test_stop_words_keep_negations():
+    assert not NEGATIONS & get_stop_words()
+
+
+def test_tokenize_and_filter_drops_extra_stop_words():
+    words = tokenize_and_filter("the farm harvest was good", extra_stop_words={'farm', 'harvest'})
+    assert 'farm' not in words and 'harvest' not in words
+    assert 'good' in words
+    assert 'farm' in tokenize_and_filter("the farm harvest was good")
+
+
+def test_stop_words_are_loaded_once_per_language(monkeypatch):
+    calls = []
+
+    class Corpus:
+        def words(self, language):
+            calls.append(language)
+            return {'english': ['the', 'a'], 'french': ['le', 'la']}[language]
+
+    monkeypatch.setattr(analysis, 'stopwords', Corpus())
+    get_stop_words.cache_clear()
+    try:
+        assert get_stop_words('english') == {'the', 'a'}
+        assert get_stop_words('french') == {'le', 'la'}
+        assert get_stop_words('english') is get_stop_words('english')
+        assert get_stop_words('french', frozenset({'ferme'})) == {'le', 'la', 'ferme'}
+        assert calls == ['english', 'french', 'french']
+    finally:
+        get_stop_words.cache_clear()
+
+
+def test_tokenize_and_filter_keeps_negations():
+    assert 'no' in tokenize_and_filter("there is no access to technology")
+
+
+def test_negated_phrase_needs_its_negation(pipeline):
+    result = pipeline.analyze("we finally have good access to technology and access to mechanization")
+    assert not result.emotions
+
+
+def test_negated_phrase_matches(pipeline):
+    result = pipeline.analyze("There is no access to technology and no access to mechanization.")
+    assert result.emotions == {'outdated tools': 1, 'manual labor strain': 1}
+
+
+@pytest.mark.parametrize('text', COMMENTS + lexicon_terms())
+def test_fast_tokenize_matches_nltk_on_cleaned_text(text):
+    cleaned = clean_text(text)
+    assert fast_tokenize(cleaned) == nltk_tokenize(cleaned)
+
+
+def test_clean_text_strips_unicode_punctuation():
+    assert clean_text("A snail’s “pace” — slow…") == "a snails pace  slow"
+
+
+@pytest.mark.parametrize('score, label', [
+    ({'neg': 0.4, 'neu': 0.5, 'pos': 0.1}, "High Stress"),
+    ({'neg': 0.1, 'neu': 0.5, 'pos': 0.4}, "Low Stress"),
+    ({'neg': 0.2, 'neu': 0.6, 'pos': 0.2}, "Neutral Stress Level"),
+    ({'neg': 0.0, 'neu': 1.0, 'pos': 0.0}, "Neutral Stress Level"),
+])
+def test_stress_label(score, label):
+    assert stress_label(score) == label
+
+
+def test_sentiment_analyzer_is_shared():
+    assert get_sentiment_analyzer() is get_sentiment_analyzer()
+
+
+def test_sentiment_analysis_batch_matches_single_calls():
+    texts = ["the harvest is good", "the drought is bad", "we planted maize", ""]
+    results = sentiment_analysis_batch(texts)
+    assert [result['label'] for result in results] == [sentiment_analysis(text) for text in texts]
+    assert results[0]['label'] == "Low Stress" and results[1]['label'] == "High Stress"
+    for text, result in zip(texts, results):
+        assert set(result) == {'neg', 'neu', 'pos', 'compound', 'label'}
+        assert {key: result[key] for key in ('neg', 'neu', 'pos', 'compound')} == \
+            get_sentiment_analyzer().polarity_scores(text)
+
+
+def test_sentiment_analysis_batch_of_nothing():
+    assert sentiment_analysis_batch([]) == []
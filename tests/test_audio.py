@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import speech_recognition as sr
+
+from audio import AudioRecordingBuffer, pcm_samples, speech_frames, trim_silence
+
+RATE = 16000
+
+
+def tone(seconds):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (np.sin(2 * np.pi * 440 * t) * 10000).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(RATE * seconds), dtype=np.int16)
+
+
+def audio_data(*parts):
+    return sr.AudioData(np.concatenate(parts).tobytes(), RATE, 2)
+
+
+def longest_pause(audio):
+    speech, _ = speech_frames(pcm_samples(audio), RATE, hangover_ms=0)
+    longest = run = 0
+    for is_speech in speech:
+        run = 0 if is_speech else run + 1
+        longest = max(longest, run)
+    return longest * 0.03
+
+
+def test_trim_silence_shortens_pause_when_recording_starts_with_speech():
+    trimmed, removed = trim_silence(audio_data(tone(1), silence(3), tone(1), silence(1)), max_pause_ms=500)
+    assert 0.4 <= longest_pause(trimmed) <= 0.6
+    assert 2.5 < removed < 3.5
+
+
+def test_trim_silence_shortens_pause_when_recording_starts_with_silence():
+    trimmed, _ = trim_silence(audio_data(silence(1), tone(1), silence(3), tone(1), silence(1)), max_pause_ms=500)
+    assert 0.4 <= longest_pause(trimmed) <= 0.6
+
+
+def test_trim_silence_shortens_every_pause_to_max_pause():
+    parts = [tone(0.5)]
+    for _ in range(25):
+        parts += [silence(1), tone(0.5)]
+    trimmed, removed = trim_silence(audio_data(*parts), max_pause_ms=500)
+    assert 0.4 <= longest_pause(trimmed) <= 0.6
+    assert 12 <= removed <= 13
+
+
+def test_trim_silence_keeps_hangover_around_leading_and_trailing_speech():
+    trimmed, removed = trim_silence(audio_data(silence(2), tone(1), silence(2)), hangover_ms=200)
+    assert 1.3 <= len(pcm_samples(trimmed)) / RATE <= 1.5
+    assert 3.5 <= removed <= 3.7
+
+
+def test_trim_silence_keeps_short_pauses():
+    trimmed, _ = trim_silence(audio_data(tone(1), silence(0.3), tone(1)), max_pause_ms=500)
+    assert 0.2 <= longest_pause(trimmed) <= 0.35
+
+
+def test_trim_silence_returns_none_without_speech():
+    trimmed, removed = trim_silence(audio_data(silence(2)))
+    assert trimmed is None
+    assert removed == 2.0
+
+
+def frame(samples, channels, planar, sample_rate=RATE):
+    return SimpleNamespace(
+        to_ndarray=lambda: samples,
+        format=SimpleNamespace(is_planar=planar),
+        layout=SimpleNamespace(channels=[None] * channels),
+        sample_rate=sample_rate,
+    )
+
+
+def test_recording_buffer_keeps_audio_across_blocks():
+    buffer = AudioRecordingBuffer(max_seconds=3, block_seconds=1)
+    samples = np.arange(int(RATE * 2.5), dtype=np.int16)
+    for start in range(0, len(samples), 960):
+        buffer.write(samples[start:start + 960], RATE)
+    assert not buffer.full
+    assert np.array_equal(pcm_samples(buffer.to_audio_data()), samples)
+
+
+def test_recording_buffer_stops_when_full_instead_of_overwriting():
+    buffer = AudioRecordingBuffer(max_seconds=1, block_seconds=1)
+    buffer.write(np.ones(RATE, dtype=np.int16), RATE)
+    buffer.write(np.full(100, 7, dtype=np.int16), RATE)
+    assert buffer.full
+    assert np.array_equal(pcm_samples(buffer.to_audio_data()), np.ones(RATE, dtype=np.int16))
+    buffer.clear()
+    assert not buffer.full and buffer.to_audio_data() is None
+
+
+def test_recording_buffer_downmixes_interleaved_and_planar_frames():
+    left = np.full(480, 1000, dtype=np.int16)
+    right = np.full(480, 3000, dtype=np.int16)
+    buffer = AudioRecordingBuffer()
+    buffer.write_frame(frame(np.stack([left, right], axis=1).reshape(1, -1), channels=2, planar=False))
+    buffer.write_frame(frame(np.stack([left, right]), channels=2, planar=True))
+    buffer.write_frame(frame(np.full((1, 480), 0.5, dtype=np.float32), channels=1, planar=True))
+    samples = pcm_samples(buffer.to_audio_data())
+    assert np.array_equal(samples[:960], np.full(960, 2000, dtype=np.int16))
+    assert np.all(samples[960:] == 16384)
+
+
+def test_recording_buffer_stores_every_queued_frame_in_order():
+    buffer = AudioRecordingBuffer()
+    frames = [frame(np.full((1, 480), n, dtype=np.int16), channels=1, planar=True) for n in range(1, 6)]
+    assert asyncio.run(buffer.write_frames(frames)) == frames
+    samples = pcm_samples(buffer.to_audio_data())
+    assert np.array_equal(samples, np.repeat(np.arange(1, 6, dtype=np.int16), 480))
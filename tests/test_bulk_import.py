@@ -0,0 +1,42 @@
+import json
+import sqlite3
+
+import pytest
+
+from bulk_import import bulk_import, parse_timestamp
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-05-01 10:00:00', '2024-05-01 10:00:00'),
+    ('2024-05-01T10:00:00Z', '2024-05-01 10:00:00'),
+    ('2024-05-01T11:00:00+01:00', '2024-05-01 10:00:00'),
+    ('2024-05-01', '2024-05-01 00:00:00'),
+])
+def test_parse_timestamp_normalizes_to_utc(value, expected):
+    assert parse_timestamp(value) == expected
+
+
+def test_parse_timestamp_rejects_unparseable():
+    with pytest.raises(ValueError):
+        parse_timestamp('05/01/2024 10:00')
+
+
+def test_bulk_import_rejects_bad_timestamps_and_labels(tmp_path):
+    rows = [
+        {'name': 'ada', 'comment': 'rain at last', 'sentiment': 'Low Stress', 'timestamp': '2024-05-01T10:00:00Z'},
+        {'name': 'ada', 'comment': 'pests again', 'sentiment': 'High Stress', 'timestamp': '05/01/2024 10:00'},
+        {'name': 'ada', 'comment': 'loan due', 'sentiment': 'Very Stressed'},
+        {'name': 'ada', 'comment': 'harvest done', 'sentiment': 'Neutral Stress Level'},
+    ]
+    source = tmp_path / 'comments.jsonl'
+    source.write_text('\n'.join(json.dumps(row) for row in rows), encoding='utf-8')
+    database = str(tmp_path / 'test.db')
+
+    inserted, invalid, skipped, _ = bulk_import(str(source), database=database, batch_size=1)
+
+    assert (inserted, invalid, skipped) == (2, 2, 0)
+    conn = sqlite3.connect(database)
+    stored = conn.execute('SELECT comment, timestamp, sentiment_code FROM comments ORDER BY id').fetchall()
+    conn.close()
+    assert stored[0] == ('rain at last', '2024-05-01 10:00:00', 0)
+    assert stored[1][0] == 'harvest done' and stored[1][2] == 1
@@ -0,0 +1,409 @@
+import logging
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import database as database_module
+from database import INSERT_COMMENT_SQL, STORAGE_PROFILES, CommentWriter, close_pools, create_connection, migrate, \
+    search_comments
+
+
+def index_names(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                                               (table,))}
+    finally:
+        conn.close()
+
+
+def count_comments(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_comment_writer_loses_only_the_bad_row(database):
+    writer = CommentWriter(database, batch_size=10, flush_interval=0.05, retry_delay=0.01)
+    writer.submit('ada', 'rain at last', 'Low Stress', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+    writer.submit('ada', None, 'High Stress', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+    writer.submit('ada', 'pests again', 'High Stress', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+    writer.close()
+
+    assert count_comments(database) == 2
+    metrics = writer.metrics()
+    assert (metrics['written'], metrics['failed']) == (2, 1)
+    assert [params[1] for params, _ in writer.failed_rows] == [None]
+
+
+def test_comment_writer_retries_a_failed_batch(database, monkeypatch):
+    writer = CommentWriter(database, batch_size=10, flush_interval=0.05, retry_delay=0.01)
+    write = writer._write
+    calls = []
+
+    def locked_once(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        write(batch)
+
+    monkeypatch.setattr(writer, '_write', locked_once)
+    writer.submit('ada', 'rain at last', 'Low Stress', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+    writer.submit('ada', 'pests again', 'High Stress', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+    writer.close()
+
+    assert calls == [2, 2]
+    assert count_comments(database) == 2
+    assert writer.metrics()['failed'] == 0
+
+
+@pytest.fixture
+def searchable(database):
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.executemany('''
+            INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city,
+                                  destination_area)
+            VALUES (?, ?, 'High Stress', 'Unknown', 'Unknown', 'Unknown', 'Unknown')
+        ''', [('ada', "the farmer's fertilizer-price worries"), ('bo', 'locusts ate the maize')])
+    conn.close()
+    return database
+
+
+@pytest.mark.parametrize('query', ["farmer's", 'fertilizer-price', 'worries OR', 'NEAR('])
+def test_search_comments_treats_plain_queries_as_text(searchable, query):
+    results = search_comments(query, path=searchable)
+    assert all(name == 'ada' for _, name, *_ in results)
+
+
+def test_search_comments_finds_hyphenated_terms(searchable):
+    assert [row[1] for row in search_comments('fertilizer-price', path=searchable)] == ['ada']
+
+
+def test_search_comments_raw_syntax_errors_raise_value_error(searchable):
+    assert [row[1] for row in search_comments('locusts OR worries', raw=True, path=searchable)] != []
+    with pytest.raises(ValueError):
+        search_comments('fertilizer-price', raw=True, path=searchable)
+
+
+@pytest.fixture
+def app_connection(database, monkeypatch):
+    """
+    Route the module's pooled connections, which default to database.db, to the
+    test database.
+    """
+    conn = sqlite3.connect(database, check_same_thread=False)
+
+    @contextmanager
+    def pooled(path=None):
+        yield conn
+
+    monkeypatch.setattr(database_module, 'pooled_connection', pooled)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def traced_statements(app_connection):
+    """
+    Collect the SELECT and UPDATE statements run on the app connection, with
+    parameters filled in.
+    """
+    statements = []
+    app_connection.set_trace_callback(
+        lambda sql: statements.append(sql) if sql.lstrip().upper().startswith(('SELECT', 'UPDATE')) else None)
+    return statements
+
+
+def query_plan(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+    finally:
+        conn.close()
+
+
+def assert_uses_index(path, statements, index):
+    assert statements
+    for sql in statements:
+        plan = query_plan(path, sql)
+        assert any(re.search(rf'USING (COVERING )?INDEX {index}\b', step) for step in plan), (sql, plan)
+        assert not any('TEMP B-TREE' in step for step in plan), (sql, plan)
+
+
+@pytest.mark.parametrize('call', [
+    lambda: database_module.authenticate_user('ada', 'secret'),
+    lambda: database_module.check_user_exists('ada'),
+    lambda: database_module.reset_password('ada', 'new secret'),
+], ids=['login', 'user lookup', 'reset'])
+def test_user_queries_use_the_username_index(database, traced_statements, call):
+    call()
+    # The UNIQUE constraint's own index; users_username would only duplicate it
+    assert index_names(database, 'users') == {'sqlite_autoindex_users_1'}
+    assert_uses_index(database, traced_statements, 'sqlite_autoindex_users_1')
+
+
+@pytest.mark.parametrize('after_cursor', [None, ('2024-05-01 10:00:00', 10)], ids=['first page', 'next page'])
+def test_user_timeline_uses_the_name_timestamp_index(database, traced_statements, after_cursor):
+    database_module.get_comments_page(after_cursor, filters={'name': 'ada'})
+    assert_uses_index(database, traced_statements, 'comments_name_timestamp')
+
+
+@pytest.mark.parametrize('after_cursor', [None, ('2024-05-01 10:00:00', 10)], ids=['first page', 'next page'])
+def test_global_timeline_uses_the_timestamp_index(database, traced_statements, after_cursor):
+    database_module.get_comments_page(after_cursor)
+    # Not comments_timestamp_scores or comments_timestamp_area, which would need a
+    # sort for the id tie-break
+    assert_uses_index(database, traced_statements, 'comments_timestamp')
+
+
+def test_top_emotions_by_area_reads_only_the_time_range(database, traced_statements):
+    database_module.get_top_emotions_by_area(days=30)
+    assert traced_statements
+    for sql in traced_statements:
+        plan = query_plan(database, sql)
+        assert any('SEARCH c USING COVERING INDEX comments_timestamp_area' in step for step in plan), (sql, plan)
+        assert any('SEARCH ce USING PRIMARY KEY (comment_id=?)' in step for step in plan), (sql, plan)
+        assert not any(step.startswith('SCAN ce') for step in plan), (sql, plan)
+
+
+def test_duplicate_usernames_are_kept_aside_by_migration(tmp_path, caplog):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute('''
+            CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL,
+                                password TEXT NOT NULL, email TEXT NOT NULL)
+        ''')
+        conn.executemany('INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
+                         [('seun', 'a', 'first@example.com'), ('seun', 'b', 'second@example.com')])
+    conn.close()
+
+    with caplog.at_level(logging.WARNING, logger='database'):
+        migrate(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute('SELECT email FROM users').fetchall() == [('first@example.com',)]
+        assert conn.execute('SELECT email FROM users_duplicates').fetchall() == [('second@example.com',)]
+    finally:
+        conn.close()
+    assert 'Migration 2 removed 1 rows' in caplog.text
+    assert index_names(path, 'users') == {'users_username'}
+
+
+def test_migration_drops_duplicate_username_index(database):
+    conn = sqlite3.connect(database)
+    try:
+        # As left by migration 2 before it checked for the UNIQUE constraint
+        conn.execute('CREATE UNIQUE INDEX users_username ON users (username)')
+        conn.execute('PRAGMA user_version = 9')
+        conn.commit()
+    finally:
+        conn.close()
+    close_pools()
+    assert migrate(database) == len(database_module.MIGRATIONS)
+    assert index_names(database, 'users') == {'sqlite_autoindex_users_1'}
+
+
+@pytest.mark.parametrize('profile', sorted(STORAGE_PROFILES))
+def test_concurrent_readers_and_writers_are_never_locked_out(database, profile):
+    # Pooled connections from migrate() would keep the database in WAL mode. The
+    # journal mode is switched once up front, as the first pooled connection does
+    # at startup, before sessions share the database.
+    close_pools()
+    create_connection(database, profile).close()
+    writers, readers, inserts = 4, 4, 50
+    errors = []
+    writing = threading.Barrier(writers + readers)
+    done = threading.Event()
+
+    def write(n):
+        conn = None
+        try:
+            conn = create_connection(database, profile)
+            writing.wait()
+            for i in range(inserts):
+                with conn:
+                    conn.execute(INSERT_COMMENT_SQL, (f'writer{n}', f'comment {i}', 'High Stress', 'Unknown', 'Unknown',
+                                                      'Unknown', 'Unknown', 0.5, 0.3, 0.2, -0.4))
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def read():
+        conn = None
+        try:
+            conn = create_connection(database, profile)
+            writing.wait()
+            while not done.is_set():
+                conn.execute('SELECT COUNT(*) FROM comments').fetchone()
+                conn.execute('SELECT * FROM comments ORDER BY timestamp DESC, id DESC LIMIT 20').fetchall()
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    writer_threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    for thread in writer_threads + reader_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+
+    assert errors == []
+    conn = create_connection(database, profile)
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0].lower() == dict(STORAGE_PROFILES[profile])[
+            'journal_mode'].lower()
+        assert conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0] == writers * inserts
+    finally:
+        conn.close()
+
+
+def insert_scored_comment(conn, name, area, timestamp, compound):
+    conn.execute('''
+        INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city, destination_area,
+                              timestamp, compound)
+        VALUES (?, 'comment', 'High Stress', 'Unknown', ?, 'Unknown', 'Unknown', ?, ?)
+    ''', (name, area, timestamp, compound))
+
+
+def recomputed_rollups(conn):
+    rows = []
+    for granularity, bucket in database_module.ROLLUP_BUCKETS.items():
+        for dimension, column in database_module.ROLLUP_DIMENSIONS.items():
+            rows += conn.execute(f'''
+                SELECT ?, ?, {column}, strftime('{bucket}', timestamp), COUNT(*), ROUND(COALESCE(SUM(compound), 0), 9),
+                       COUNT(compound)
+                FROM comments GROUP BY {column}, strftime('{bucket}', timestamp)
+            ''', (granularity, dimension)).fetchall()
+    return sorted(rows)
+
+
+def stored_rollups(conn):
+    return sorted(conn.execute('''
+        SELECT granularity, dimension, key, bucket, comments, ROUND(compound_sum, 9), scored
+        FROM comment_rollups WHERE comments > 0
+    ''').fetchall())
+
+
+def test_rollup_triggers_match_a_recomputed_aggregate(database):
+    conn = sqlite3.connect(database)
+    try:
+        with conn:
+            insert_scored_comment(conn, 'ada', 'north', '2024-05-01 10:15:00', -0.5)
+            insert_scored_comment(conn, 'ada', 'north', '2024-05-01 10:45:00', 0.25)
+            insert_scored_comment(conn, 'bo', 'south', '2024-05-01 11:05:00', None)
+            insert_scored_comment(conn, 'bo', 'north', '2024-05-02 09:00:00', 0.75)
+        assert stored_rollups(conn) == recomputed_rollups(conn)
+
+        with conn:
+            conn.execute("UPDATE comments SET compound = -0.9 WHERE compound IS NULL")
+            conn.execute("UPDATE comments SET compound = NULL WHERE compound = 0.25")
+            conn.execute("UPDATE comments SET timestamp = '2024-05-03 08:00:00' WHERE compound = 0.75")
+            conn.execute("UPDATE comments SET origin_area = 'east', name = 'cy' WHERE compound = -0.5")
+        assert stored_rollups(conn) == recomputed_rollups(conn)
+
+        with conn:
+            conn.execute("DELETE FROM comments WHERE compound = -0.9")
+            conn.execute("DELETE FROM comments WHERE compound IS NULL")
+        assert stored_rollups(conn) == recomputed_rollups(conn)
+    finally:
+        conn.close()
+
+
+def test_get_stress_trend(database, app_connection):
+    conn = sqlite3.connect(database)
+    with conn:
+        insert_scored_comment(conn, 'ada', 'north', '2024-05-01 10:15:00', -0.5)
+        insert_scored_comment(conn, 'ada', 'north', '2024-05-01 18:00:00', 0.25)
+        insert_scored_comment(conn, 'bo', 'south', '2024-05-01 11:05:00', None)
+        insert_scored_comment(conn, 'bo', 'north', '2024-05-02 09:00:00', 0.75)
+    conn.close()
+
+    daily = database_module.get_stress_trend('day', 'area')
+    assert daily == [('2024-05-01', 'north', 2, -0.125), ('2024-05-01', 'south', 1, None),
+                     ('2024-05-02', 'north', 1, 0.75)]
+    assert database_module.get_stress_trend('day', 'area', key='north', since='2024-05-02') == [
+        ('2024-05-02', 'north', 1, 0.75)]
+    assert [row[1:3] for row in database_module.get_stress_trend('day', 'user')] == [
+        ('ada', 2), ('bo', 1), ('bo', 1)]
+    with pytest.raises(ValueError):
+        database_module.get_stress_trend('week', 'area')
+
+
+def insert_timeline(conn):
+    rows = [
+        ('ada', 'Low Stress', 'Ibadan', 'north', '2024-05-01 10:00:00'),
+        ('ada', 'High Stress', 'Ibadan', 'south', '2024-05-01 10:00:00'),
+        ('bo', 'High Stress', 'Lagos', 'north', '2024-05-01 10:00:00'),
+        ('bo', 'Neutral Stress Level', 'Lagos', 'south', '2024-05-02 08:00:00'),
+        ('ada', 'High Stress', 'Lagos', 'north', '2024-05-03 12:00:00'),
+    ]
+    with conn:
+        conn.executemany('''
+            INSERT INTO comments (name, comment, sentiment, origin_city, origin_area, destination_city,
+                                  destination_area, timestamp)
+            VALUES (?, 'comment', ?, ?, ?, 'Unknown', 'Unknown', ?)
+        ''', rows)
+
+
+def page_ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_comment_pages_break_timestamp_ties_by_id(app_connection):
+    insert_timeline(app_connection)
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = database_module.get_comments_page(cursor, limit=2)
+        seen += page_ids(rows)
+        if cursor is None:
+            break
+    assert seen == [5, 4, 3, 2, 1]
+
+
+def test_last_comment_page_has_no_cursor(app_connection):
+    insert_timeline(app_connection)
+    rows, cursor = database_module.get_comments_page(limit=10)
+    assert len(rows) == 5 and cursor is None
+    rows, cursor = database_module.get_comments_page(limit=5)
+    assert len(rows) == 5 and cursor == ('2024-05-01 10:00:00', 1)
+    assert database_module.get_comments_page(cursor, limit=5) == ([], None)
+
+
+@pytest.mark.parametrize('filters, expected', [
+    ({'name': 'ada'}, [5, 2, 1]),
+    ({'sentiment': 'High Stress'}, [5, 3, 2]),
+    ({'origin_city': 'Lagos'}, [5, 4, 3]),
+    ({'origin_area': 'south'}, [4, 2]),
+    ({'since': '2024-05-02 00:00:00'}, [5, 4]),
+    ({'until': '2024-05-02 00:00:00'}, [3, 2, 1]),
+    ({'name': 'ada', 'origin_area': 'north', 'until': '2024-05-02'}, [1]),
+    ({'name': None}, [5, 4, 3, 2, 1]),
+])
+def test_comment_filters(app_connection, filters, expected):
+    insert_timeline(app_connection)
+    assert set(filters) <= set(database_module.COMMENT_FILTERS)
+    assert page_ids(database_module.get_comments_page(filters=filters)[0]) == expected
+    assert page_ids(database_module.iter_comments(filters, page_size=2)) == expected
+
+
+def test_unknown_comment_filter_raises(app_connection):
+    with pytest.raises(ValueError):
+        database_module.get_comments_page(filters={'city': 'Lagos'})
+    with pytest.raises(ValueError):
+        list(database_module.iter_comments({'city': 'Lagos'}))
@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+import speech_recognition as sr
+
+from jobs import CANCELLED, DONE, FAILED, FINISHED, RUNNING, TIMED_OUT, JobQueue, JobQueueFull
+
+SLOW = sr.AudioData(b'\1\0' * 160, 16000, 2)
+FAST = sr.AudioData(b'\2\0' * 160, 16000, 2)
+
+
+def handler(audio_data, stop):
+    if audio_data.frame_data == SLOW.frame_data:
+        stop.wait(5)
+    return {'bytes': len(audio_data.frame_data)}
+
+
+def wait_for(job_queue, job_id, statuses, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.status(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_cancel_frees_the_worker(database):
+    job_queue = JobQueue(handler, path=database, workers=1)
+    slow = job_queue.submit('ada', SLOW)
+    wait_for(job_queue, slow, (RUNNING,))
+    fast = job_queue.submit('ada', FAST)
+    assert job_queue.cancel(slow)
+    assert wait_for(job_queue, fast, FINISHED, timeout=2)['status'] == DONE
+    assert job_queue.status(slow)['status'] == CANCELLED
+    job_queue.close()
+
+
+def test_database_error_fails_the_job_and_keeps_the_worker(database, monkeypatch):
+    job_queue = JobQueue(handler, path=database, workers=1)
+    claim = job_queue._claim
+    calls = []
+
+    def flaky_claim(job_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return claim(job_id)
+
+    monkeypatch.setattr(job_queue, '_claim', flaky_claim)
+    first = job_queue.submit('ada', FAST)
+    assert wait_for(job_queue, first, FINISHED)['status'] == FAILED
+    second = job_queue.submit('ada', FAST)
+    assert wait_for(job_queue, second, FINISHED)['status'] == DONE
+    job_queue.close()
+
+
+def test_timed_out_handlers_are_stopped_and_capped(database):
+    release = threading.Event()
+    stops = []
+
+    def stuck(audio_data, stop):
+        stops.append(stop)
+        release.wait(5)
+
+    job_queue = JobQueue(stuck, path=database, workers=1, timeout=0.05, max_abandoned=1)
+    job_id = job_queue.submit('ada', FAST)
+    assert wait_for(job_queue, job_id, FINISHED)['status'] == TIMED_OUT
+    assert stops[0].is_set()
+    with pytest.raises(JobQueueFull):
+        job_queue.submit('ada', FAST)
+    release.set()
+    time.sleep(0.1)
+    assert job_queue.metrics()['abandoned'] == 0
+    job_queue.close()
+
+
+def test_submit_keeps_audio_out_of_the_database(database):
+    release = threading.Event()
+    job_queue = JobQueue(lambda audio_data, stop: release.wait(5) and {}, path=database, workers=1)
+    first = job_queue.submit('ada', FAST)
+    queued = job_queue.submit('ada', SLOW)
+    conn = sqlite3.connect(database)
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM jobs WHERE audio IS NOT NULL').fetchone()[0] == 0
+    finally:
+        conn.close()
+    assert job_queue.cancel(queued)
+    release.set()
+    assert wait_for(job_queue, first, FINISHED)['status'] == DONE
+    assert job_queue._audio == {}
+    job_queue.close()
@@ -0,0 +1,212 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import speech_recognition as sr
+
+import speech
+from audio import pcm_samples
+from speech import StubBackend, TranscriptCache, TranscriptionCancelled, get_backend, transcribe, transcribe_chunked
+
+VOICE = sr.AudioData(b'\1\0' * 8000, 16000, 2)  # half a second
+SILENT = sr.AudioData(b'\0\0' * 8000, 16000, 2)
+RATE = 16000
+
+
+def numbered_recording(count):
+    """
+    count one-second tones with a second of silence between them; tone n peaks at n * 1000 so each chunk
+    can be told apart.
+    """
+    t = np.arange(RATE) / RATE
+    parts = [(np.sin(2 * np.pi * 440 * t) * 1000).astype(np.int16)]
+    for number in range(2, count + 1):
+        parts.append(np.zeros(RATE, dtype=np.int16))
+        parts.append((np.sin(2 * np.pi * 440 * t) * number * 1000).astype(np.int16))
+    return sr.AudioData(np.concatenate(parts).tobytes(), RATE, 2)
+
+
+class NumberBackend(StubBackend):
+    """
+    Transcribes each tone of numbered_recording as its number. Earlier chunks take
+    longer, so they finish out of order. Numbers in failures raise RequestError the
+    first time they are seen, numbers in unknown raise UnknownValueError.
+    """
+
+    def __init__(self, failures=(), unknown=()):
+        super().__init__()
+        self.failures = set(failures)
+        self.unknown = set(unknown)
+
+    def _recognize(self, audio_data):
+        number = int(round(np.abs(pcm_samples(audio_data)).max() / 1000))
+        time.sleep(0.01 * (5 - number))
+        if number in self.failures:
+            self.failures.discard(number)
+            raise sr.RequestError('connection reset')
+        if number in self.unknown:
+            raise sr.UnknownValueError()
+        return str(number)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(speech.time, 'time', lambda: now[0])
+    return now
+
+
+def test_cache_memory_hit(database):
+    cache = TranscriptCache(database)
+    assert cache.get('a') is None
+    cache.put('a', 'low crop yield')
+    assert cache.get('a') == 'low crop yield'
+    metrics = cache.metrics()
+    assert (metrics['memory_hits'], metrics['disk_hits'], metrics['misses']) == (1, 0, 1)
+    assert metrics['memory_entries'] == 1
+    assert metrics['hit_rate'] == 0.5
+
+
+def test_cache_disk_hit_is_remembered_in_memory(database):
+    TranscriptCache(database).put('a', 'low crop yield')
+    cache = TranscriptCache(database)
+    assert cache.get('a') == 'low crop yield'
+    assert cache.get('a') == 'low crop yield'
+    metrics = cache.metrics()
+    assert (metrics['memory_hits'], metrics['disk_hits'], metrics['misses']) == (1, 1, 0)
+    assert metrics['hit_rate'] == 1.0
+
+
+def test_cache_entries_expire_after_ttl(database, clock):
+    cache = TranscriptCache(database, ttl=60)
+    cache.put('a', 'low crop yield')
+    clock[0] += 59
+    assert cache.get('a') == 'low crop yield'
+    assert TranscriptCache(database, ttl=60).get('a') == 'low crop yield'
+    clock[0] += 2
+    assert cache.get('a') is None
+    assert TranscriptCache(database, ttl=60).get('a') is None
+    # The expired row is deleted by the next put
+    cache.put('b', 'pest infestation')
+    assert cache.metrics()['disk_evictions'] == 1
+
+
+def test_cache_evicts_least_recently_used_from_memory(database):
+    cache = TranscriptCache(database, max_entries=2)
+    cache.put('a', 'one')
+    cache.put('b', 'two')
+    cache.get('a')
+    cache.put('c', 'three')
+    metrics = cache.metrics()
+    assert metrics['memory_evictions'] == 1
+    assert metrics['memory_entries'] == 2
+    assert cache.get('b') == 'two'  # still on disk
+    assert cache.metrics()['disk_hits'] == 1
+
+
+def test_cache_keeps_newest_rows_on_disk(database, clock):
+    cache = TranscriptCache(database, max_entries=1, max_rows=2)
+    for key in 'abc':
+        cache.put(key, key * 3)
+        clock[0] += 1
+    assert cache.metrics()['disk_evictions'] == 1
+    fresh = TranscriptCache(database)
+    assert fresh.get('a') is None
+    assert fresh.get('b') == 'bbb'
+    assert fresh.get('c') == 'ccc'
+
+
+def test_transcribe_reuses_cached_transcript(database):
+    backend = StubBackend()
+    cache = TranscriptCache(database)
+    transcript = transcribe(backend, VOICE, cache)
+    assert transcript in StubBackend.transcripts
+    assert transcribe(backend, VOICE, cache) == transcript
+    assert backend.metrics()['calls'] == 1
+    assert cache.metrics()['memory_hits'] == 1
+
+
+def test_transcribe_does_not_cache_unrecognized_audio(database):
+    backend = StubBackend()
+    cache = TranscriptCache(database)
+    for _ in range(2):
+        with pytest.raises(sr.UnknownValueError):
+            transcribe(backend, SILENT, cache)
+    assert backend.metrics()['calls'] == 2
+
+
+def test_backend_metrics_report_latency_and_real_time_factor():
+    backend = StubBackend(real_time_factor=0.1)
+    for _ in range(2):
+        backend.recognize(VOICE)
+    metrics = backend.metrics()
+    assert metrics['calls'] == 2
+    assert metrics['audio_seconds'] == pytest.approx(1.0)
+    assert 0.05 <= metrics['mean_latency'] < 0.5
+    assert 0.1 <= metrics['real_time_factor'] < 1.0
+
+
+def test_get_backend_defaults_to_recognizer_backend(monkeypatch):
+    monkeypatch.setattr(speech, 'RECOGNIZER_BACKEND', 'stub')
+    assert get_backend() is get_backend('stub')
+    assert isinstance(get_backend(), StubBackend)
+    with pytest.raises(ValueError):
+        get_backend('nonexistent')
+
+
+def test_transcribe_chunked_joins_chunks_in_order():
+    transcript, timings = transcribe_chunked(NumberBackend(), numbered_recording(4), max_chunk_seconds=2.5)
+    assert transcript == '1 2 3 4'
+    assert [timing['attempts'] for timing in timings] == [1, 1, 1, 1]
+    assert sum(timing['audio_seconds'] for timing in timings) == pytest.approx(7.0)
+
+
+def test_transcribe_chunked_retries_only_the_failed_chunk():
+    backend = NumberBackend(failures={2})
+    transcript, timings = transcribe_chunked(backend, numbered_recording(4), max_chunk_seconds=2.5,
+                                             retry_delay=0.01)
+    assert transcript == '1 2 3 4'
+    assert [timing['attempts'] for timing in timings] == [1, 2, 1, 1]
+    assert backend.metrics()['calls'] == 5
+
+
+def test_transcribe_chunked_gives_up_after_retries():
+    backend = NumberBackend(failures={2})
+    with pytest.raises(sr.RequestError):
+        transcribe_chunked(backend, numbered_recording(4), max_chunk_seconds=2.5, retries=0)
+
+
+def test_transcribe_chunked_drops_unrecognized_chunks():
+    transcript, timings = transcribe_chunked(NumberBackend(unknown={1, 3}), numbered_recording(4),
+                                             max_chunk_seconds=2.5)
+    assert transcript == '2 4'
+    assert len(timings) == 4
+    with pytest.raises(sr.UnknownValueError):
+        transcribe_chunked(NumberBackend(unknown={1, 2, 3, 4}), numbered_recording(4), max_chunk_seconds=2.5)
+
+
+def test_transcribe_chunked_stops_when_cancelled():
+    stop = threading.Event()
+    stop.set()
+    backend = NumberBackend()
+    with pytest.raises(TranscriptionCancelled):
+        transcribe_chunked(backend, numbered_recording(4), max_chunk_seconds=2.5, stop=stop)
+    assert backend.metrics()['calls'] == 0
+
+
+def test_transcribe_chunked_cancel_interrupts_retry_delay():
+    stop = threading.Event()
+
+    class CancellingBackend(NumberBackend):
+        def _recognize(self, audio_data):
+            try:
+                return super()._recognize(audio_data)
+            except sr.RequestError:
+                stop.set()
+                raise
+
+    start = time.monotonic()
+    with pytest.raises(TranscriptionCancelled):
+        transcribe_chunked(CancellingBackend(failures={1}), numbered_recording(1), retry_delay=30, stop=stop)
+    assert time.monotonic() - start < 5